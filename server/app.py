@@ -3,22 +3,76 @@ from flask_caching import Cache
 
 from dotenv import load_dotenv
 import os
+import tempfile
 load_dotenv()
 
 from models import db
+import upstream
+import etags
+import encoding
+import codec
+import assets
+import asyncdb
+import metrics
 
 config = {
     'DEBUG': True,          # some Flask specific configs
-    'CACHE_TYPE': 'SimpleCache',  # Flask-Caching related configs
+    'CACHE_TYPE': os.getenv('CACHE_TYPE', 'FileSystemCache'),  # Flask-Caching related configs (shared by every worker, RedisCache or FileSystemCache)
     'CACHE_DEFAULT_TIMEOUT': 300,
+    'CACHE_KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'silverwolf/'),
+    'CACHE_REDIS_URL': os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+    'CACHE_DIR': os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'silverwolf-cache')),
+    'CACHE_THRESHOLD': int(os.getenv('CACHE_THRESHOLD', 20000)),
     'SQLALCHEMY_DATABASE_URI': os.getenv('SUPABASE_DB_URI'),
-    'SQLALCHEMY_TRACK_MODIFICATIONS': True
+    'SQLALCHEMY_TRACK_MODIFICATIONS': True,
+    'ASYNC_DB': os.getenv('ASYNC_DB', 'false').lower() == 'true',                  # asyncdb.py: async engine for worker.py/backfill.py writes (asyncpg, url derived from SUPABASE_DB_URI)
+    'ASYNC_DB_URI': os.getenv('ASYNC_DB_URI'),
+    'ASYNC_DB_POOL_SIZE': int(os.getenv('ASYNC_DB_POOL_SIZE', 10)),
+    'ASYNC_DB_MAX_OVERFLOW': int(os.getenv('ASYNC_DB_MAX_OVERFLOW', 10)),
+    'UPSTREAM_TOTAL_TIMEOUT': float(os.getenv('UPSTREAM_TOTAL_TIMEOUT', 10)),      # upstream (henrikdev/valorant-api) client configs
+    'UPSTREAM_CONNECT_TIMEOUT': float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3)),
+    'UPSTREAM_LIMIT': int(os.getenv('UPSTREAM_LIMIT', 100)),
+    'UPSTREAM_LIMIT_PER_HOST': int(os.getenv('UPSTREAM_LIMIT_PER_HOST', 20)),
+    'UPSTREAM_DNS_TTL': int(os.getenv('UPSTREAM_DNS_TTL', 300)),
+    'UPSTREAM_KEEPALIVE_TIMEOUT': float(os.getenv('UPSTREAM_KEEPALIVE_TIMEOUT', 30)),
+    'UPSTREAM_RATE_LIMIT': int(os.getenv('UPSTREAM_RATE_LIMIT', 30)),              # requests per window until the api tells us otherwise
+    'UPSTREAM_RATE_WINDOW': float(os.getenv('UPSTREAM_RATE_WINDOW', 60)),
+    'UPSTREAM_MAX_RETRIES': int(os.getenv('UPSTREAM_MAX_RETRIES', 3)),
+    'UPSTREAM_BACKOFF_BASE': float(os.getenv('UPSTREAM_BACKOFF_BASE', 0.5)),
+    'UPSTREAM_BACKOFF_CAP': float(os.getenv('UPSTREAM_BACKOFF_CAP', 8)),
+    'UPSTREAM_MAX_WAIT': float(os.getenv('UPSTREAM_MAX_WAIT', 5)),                # how long a route call may queue before we give up with a 503
+    'UPSTREAM_BACKGROUND_MAX_WAIT': float(os.getenv('UPSTREAM_BACKGROUND_MAX_WAIT', 120)),
+    'UPSTREAM_BACKGROUND_RESERVE': float(os.getenv('UPSTREAM_BACKGROUND_RESERVE', 0.2)),
+    'PLAYER_FRESHNESS_SECONDS': int(os.getenv('PLAYER_FRESHNESS_SECONDS', 600)),   # stored profiles older than this are served but refreshed in the background
+    'INLINE_COLD_FETCH': os.getenv('INLINE_COLD_FETCH', 'true').lower() == 'true',  # fetch things we've never stored inline, otherwise queue them (202)
+    'BATCH_LOOKUP_MAX_PLAYERS': int(os.getenv('BATCH_LOOKUP_MAX_PLAYERS', 25)),      # most players one POST /users/batch may ask for
+    'BACKFILL_CONCURRENCY': int(os.getenv('BACKFILL_CONCURRENCY', 20)),            # backfill.py: match fetches in flight at once, matches per commit, default matches per player
+    'BACKFILL_BATCH_SIZE': int(os.getenv('BACKFILL_BATCH_SIZE', 10)),
+    'BACKFILL_MAX_MATCHES': int(os.getenv('BACKFILL_MAX_MATCHES', 20)),
+    'ASSETS_SNAPSHOT_PATH': os.getenv('ASSETS_SNAPSHOT_PATH', os.path.join(tempfile.gettempdir(), 'silverwolf-assets.json')),  # assets.py catalog (tiers, titles, cards), 0 seconds = never refresh
+    'ASSETS_REFRESH_SECONDS': int(os.getenv('ASSETS_REFRESH_SECONDS', 6 * 3600)),
+    'ASSETS_RETRY_SECONDS': int(os.getenv('ASSETS_RETRY_SECONDS', 300)),
+    'HEATMAP_BINS': int(os.getenv('HEATMAP_BINS', 64)),                              # /heatmap grid (bins per side, over -extent..extent in game coordinates)
+    'HEATMAP_EXTENT': int(os.getenv('HEATMAP_EXTENT', 16000)),
+    'HEATMAP_REBUILD_SECONDS': int(os.getenv('HEATMAP_REBUILD_SECONDS', 3600)),
+    'WORKER_CONCURRENCY': int(os.getenv('WORKER_CONCURRENCY', 8)),                   # worker.py configs
+    'WORKER_POLL_INTERVAL': float(os.getenv('WORKER_POLL_INTERVAL', 1)),
+    'JOB_LEASE_SECONDS': int(os.getenv('JOB_LEASE_SECONDS', 120)),
+    'JOB_MAX_ATTEMPTS': int(os.getenv('JOB_MAX_ATTEMPTS', 5)),
+    'JOB_RETRY_DELAY': int(os.getenv('JOB_RETRY_DELAY', 30))
 }
 
 app = Flask(__name__)
+app.json = codec.JSONProvider(app)
 app.config.from_mapping(config)
 cache = Cache(app)
 
+metrics.init_app(app, cache)
 db.init_app(app)
+upstream.init_app(app)
+assets.init_app(app)
+asyncdb.init_app(app)
+etags.init_app(app)
+encoding.init_app(app)
 
 import routes
\ No newline at end of file
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import atexit
+import asyncio
+import threading
+
+import upstream
+
+from typing import Dict, NamedTuple, Optional
+
+'''
+Catalog of the static game assets we show (competitive tier icons per episode, player titles, player cards) from valorant-api.com
+- Loaded at startup from an on-disk snapshot (ASSETS_SNAPSHOT_PATH), so no request ever waits on valorant-api for them
+- Refreshed on the upstream I/O loop every ASSETS_REFRESH_SECONDS at background priority, and the snapshot is rewritten afterwards.
+  Workers re-read the snapshot before refreshing, so the first stale worker downloads and the others pick its snapshot up
+- Lookups are plain dict gets on an immutable catalog that refreshes swap out whole, safe from any thread or event loop
+- Without a snapshot (first boot) the first refresh starts right away, callers that store lookups wait for a download with
+  ensure_loaded(), the others come back empty until it lands
+'''
+
+# overridable so benchmarks can point it at a local stub (bench/stub_henrik.py)
+VALORANT_API_URL = os.getenv('VALORANT_API_URL', 'https://valorant-api.com').rstrip('/')
+
+TIERS_URL = f'{VALORANT_API_URL}/v1/competitivetiers'
+TITLES_URL = f'{VALORANT_API_URL}/v1/playertitles'
+CARDS_URL = f'{VALORANT_API_URL}/v1/playercards'
+
+class Catalog(NamedTuple):
+    fetched_at: int
+    tiers: Dict[str, Dict[int, str]]     # episode (competitive tier table uuid) -> tier id -> large icon url
+    current_episode: Optional[str]       # the newest tier table, what tier ids refer to unless an episode is given
+    titles: Dict[str, Optional[str]]     # title uuid -> title text
+    cards: Dict[str, str]                # card uuid -> small art url
+
+EMPTY_CATALOG = Catalog(0, {}, None, {}, {})
+
+_settings = {
+    'snapshot_path': 'assets.json',
+    'refresh_seconds': 6 * 3600,
+    'retry_seconds': 300
+}
+
+_catalog: Catalog = EMPTY_CATALOG
+_logger = None
+_refresher_pid: Optional[int] = None
+_refresher = None
+_refresher_lock = threading.Lock()
+
+# Load the snapshot and start refreshing it in the background for this worker
+
+def init_app(app):
+    global _logger
+
+    _settings.update({
+        'snapshot_path': app.config.get('ASSETS_SNAPSHOT_PATH', _settings['snapshot_path']),
+        'refresh_seconds': app.config.get('ASSETS_REFRESH_SECONDS', _settings['refresh_seconds']),
+        'retry_seconds': app.config.get('ASSETS_RETRY_SECONDS', _settings['retry_seconds'])
+    })
+    _logger = app.logger
+    load_snapshot()
+    if _settings['refresh_seconds'] > 0:
+        start()
+        # registered after upstream's, so it runs before the I/O loop is stopped
+        atexit.register(stop)
+
+# The current catalog, making sure this process refreshes it (a worker forked after init_app has no refresh task yet)
+
+def catalog() -> Catalog:
+    if _refresher_pid is not None and _refresher_pid != os.getpid():
+        start()
+    return _catalog
+
+# Lookups
+
+# 'None' when the tier isn't in the catalog, like unknown titles (it's stored, and mmr_history.account_rank_img can't be null)
+
+def get_rank_img(tier: int, episode: Optional[str] = None) -> str:
+    current = catalog()
+    return current.tiers.get(episode or current.current_episode, {}).get(tier) or 'None'
+
+def get_title(title_id: str) -> Optional[str]:
+    return catalog().titles.get(title_id, 'None')
+
+def get_card(card_id: str) -> Optional[str]:
+    return catalog().cards.get(card_id)
+
+# Snapshot file (JSON, tier ids become strings on the way through)
+
+def _read_snapshot() -> Optional[Catalog]:
+    try:
+        with open(_settings['snapshot_path']) as file:
+            snapshot = json.load(file)
+        return Catalog(
+            snapshot['fetched_at'],
+            {episode: {int(tier): icon for tier, icon in tiers.items()} for episode, tiers in snapshot['tiers'].items()},
+            snapshot['current_episode'],
+            snapshot['titles'],
+            snapshot['cards']
+        )
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError, AttributeError) as error:
+        _logger.warning(f'Ignoring unreadable asset snapshot {_settings["snapshot_path"]}: {error!r}')
+        return None
+
+def _write_snapshot(new_catalog: Catalog):
+    path = _settings['snapshot_path']
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(new_catalog._asdict(), file)
+    os.replace(tmp_path, path)
+
+# Use the snapshot on disk if it's newer than what we have, returns whether it was
+
+def load_snapshot() -> bool:
+    global _catalog
+
+    snapshot = _read_snapshot()
+    if snapshot is None or snapshot.fetched_at <= _catalog.fetched_at:
+        return False
+    _catalog = snapshot
+    return True
+
+# Index the valorant-api payloads
+
+def build_catalog(tiers_data, titles_data, cards_data) -> Catalog:
+    tiers = {
+        table['uuid']: {tier['tier']: tier['largeIcon'] for tier in table['tiers']}
+        for table in tiers_data['data']
+    }
+    return Catalog(
+        int(time.time()),
+        tiers,
+        # valorant-api lists the tables oldest first
+        tiers_data['data'][-1]['uuid'] if tiers_data['data'] else None,
+        {title['uuid']: title['titleText'] for title in titles_data['data']},
+        {card['uuid']: card['smallArt'] for card in cards_data['data']}
+    )
+
+# Download every asset list and swap the new catalog in, keeps the old one if any download fails
+
+async def _download() -> bool:
+    global _catalog
+
+    responses = await asyncio.gather(upstream.get(TIERS_URL), upstream.get(TITLES_URL), upstream.get(CARDS_URL))
+    failed = [response.status for response in responses if response.status != 200]
+    if failed:
+        _logger.warning(f'Asset refresh failed (status {failed}), keeping the catalog from {_catalog.fetched_at}')
+        return False
+
+    new_catalog = build_catalog(*(response.data for response in responses))
+    _catalog = new_catalog
+    try:
+        _write_snapshot(new_catalog)
+    except OSError as error:
+        _logger.warning(f'Could not write the asset snapshot {_settings["snapshot_path"]}: {error!r}')
+    return True
+
+async def refresh() -> bool:
+    with upstream.background():
+        return await _download()
+
+# First boot without a snapshot: wait for one download (interactive priority, shared by every caller in this worker)
+# instead of handing out empty lookups, what was stored before the catalog landed would keep them
+
+@upstream.single_flight
+async def _download_now() -> bool:
+    return await _download()
+
+async def ensure_loaded() -> Catalog:
+    if catalog().fetched_at == 0:
+        try:
+            await _download_now()
+        except upstream.UpstreamUnavailable as error:
+            _logger.warning(f'Asset download failed: {error}')
+    return catalog()
+
+async def _refresh_periodically():
+    while True:
+        age = time.time() - _catalog.fetched_at
+        if age < _settings['refresh_seconds']:
+            await asyncio.sleep(_settings['refresh_seconds'] - age)
+            continue
+
+        # another worker may have refreshed the snapshot already
+        if load_snapshot() and time.time() - _catalog.fetched_at < _settings['refresh_seconds']:
+            continue
+
+        try:
+            refreshed = await refresh()
+        except upstream.UpstreamUnavailable as error:
+            _logger.warning(f'Asset refresh failed: {error}')
+            refreshed = False
+        except Exception:
+            _logger.exception('Asset refresh failed')
+            refreshed = False
+        if not refreshed:
+            await asyncio.sleep(_settings['retry_seconds'])
+
+# Start the refresh task on this worker's I/O loop (again after a fork, the loop it ran on is gone)
+
+def start():
+    global _refresher, _refresher_pid
+
+    with _refresher_lock:
+        if _refresher_pid == os.getpid():
+            return
+        _refresher = asyncio.run_coroutine_threadsafe(_refresh_periodically(), upstream.get_loop())
+        _refresher_pid = os.getpid()
+
+def stop():
+    with _refresher_lock:
+        if _refresher is not None and _refresher_pid == os.getpid():
+            _refresher.cancel()
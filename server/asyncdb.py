@@ -0,0 +1,127 @@
+import os
+import atexit
+import asyncio
+import threading
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from models import db
+
+import upstream
+
+from typing import Callable, Optional, TypeVar
+
+'''
+Opt-in async database path (ASYNC_DB=true) for the code that runs many tasks on one event loop: worker.py and backfill.py
+- An async SQLAlchemy engine (asyncpg for postgres, aiosqlite for local sqlite runs) lives on the upstream I/O loop, next to the
+  aiohttp session, so DB round trips and upstream requests are awaited on the same loop and overlap
+- run_sync(fn, *args) runs fn(*args, session=...) in its own transaction there and commits, so the ingest.py/jobs.py writers are
+  shared with the sync path, SQLAlchemy's greenlet bridge turns their blocking calls into awaits on the async driver
+- With ASYNC_DB off it is the same call on db.session, so callers don't branch
+- The Flask views keep the sync session: each async view runs in its own event loop on its request thread, a query there only
+  ever holds up its own request (the async path wouldn't free the thread, the worker/backfill loops are where it pays off)
+'''
+
+T = TypeVar('T')
+
+_settings = {
+    'enabled': False,
+    'uri': None,
+    'pool_size': 10,
+    'max_overflow': 10
+}
+
+_app = None
+_engine = None
+_sessionmaker = None
+_pid: Optional[int] = None
+_engine_lock = threading.Lock()
+
+def init_app(app):
+    global _app
+
+    _settings.update({
+        'enabled': app.config.get('ASYNC_DB', _settings['enabled']),
+        'uri': app.config.get('ASYNC_DB_URI') or app.config['SQLALCHEMY_DATABASE_URI'],
+        'pool_size': app.config.get('ASYNC_DB_POOL_SIZE', _settings['pool_size']),
+        'max_overflow': app.config.get('ASYNC_DB_MAX_OVERFLOW', _settings['max_overflow'])
+    })
+    _app = app
+    # registered after upstream's, so the pool is closed before the I/O loop stops
+    atexit.register(stop)
+
+def enabled() -> bool:
+    return _settings['enabled']
+
+# The async driver's url for a database url: postgres -> asyncpg, sqlite -> aiosqlite (urls that name an async driver are kept)
+
+def async_uri(uri: str) -> str:
+    url = make_url(uri)
+    backend, _, driver = url.drivername.partition('+')
+    if driver in ('asyncpg', 'psycopg_async', 'aiosqlite'):
+        return uri
+    if backend in ('postgresql', 'postgres'):
+        url = url.set(drivername='postgresql+asyncpg')
+        if 'sslmode' in url.query:
+            # asyncpg takes ssl=, not libpq's sslmode=
+            url = url.update_query_dict({'ssl': url.query['sslmode']}).difference_update_query(['sslmode'])
+    elif backend == 'sqlite':
+        url = url.set(drivername='sqlite+aiosqlite')
+    return url.render_as_string(hide_password=False)
+
+# Engine and sessionmaker for this process, created on first use (again after a fork, the pool's connections belong to the old loop)
+
+def _get_sessionmaker():
+    global _engine, _sessionmaker, _pid
+
+    with _engine_lock:
+        if _sessionmaker is None or _pid != os.getpid():
+            # only imported when enabled, it needs greenlet and the async drivers
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+            uri = async_uri(_settings['uri'])
+            options = {'pool_pre_ping': True}
+            if make_url(uri).get_backend_name() != 'sqlite':
+                options.update(pool_size=_settings['pool_size'], max_overflow=_settings['max_overflow'])
+            _engine = create_async_engine(uri, **options)
+            _sessionmaker = async_sessionmaker(_engine, expire_on_commit=False)
+            _pid = os.getpid()
+        return _sessionmaker
+
+async def _run_sync(fn, args, kwargs):
+    async with _get_sessionmaker()() as session:
+        def call(sync_session: Session):
+            # app context for what runs inside (cache_tags invalidates through Flask-Caching on commit)
+            with _app.app_context():
+                result = fn(*args, session=sync_session, **kwargs)
+                sync_session.commit()
+            return result
+        return await session.run_sync(call)
+
+# Run fn(*args, session=<session>, **kwargs) in a transaction of its own and commit it, rolled back if fn raises
+
+async def run_sync(fn: Callable[..., T], *args, **kwargs) -> T:
+    if not _settings['enabled']:
+        try:
+            result = fn(*args, session=db.session(), **kwargs)
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            raise
+        return result
+
+    return await upstream.run(_run_sync(fn, args, kwargs))
+
+# Close the pool's connections on the I/O loop (registered with atexit)
+
+def stop():
+    global _engine, _sessionmaker, _pid
+
+    with _engine_lock:
+        if _engine is None or _pid != os.getpid():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(_engine.dispose(), upstream.get_loop()).result(timeout=5)
+        finally:
+            _engine, _sessionmaker, _pid = None, None, None
@@ -0,0 +1,110 @@
+import asyncio
+import argparse
+
+from flask import current_app
+from sqlalchemy import select, desc
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Valorant_Player, MMR_History, Competitive_Match
+
+import val
+import ingest
+import asyncdb
+import upstream
+
+from typing import Dict, List, Optional
+
+'''
+Bulk match ingestion for a player: the matches in their stored mmr history that aren't in competitive_match yet
+- One query for the player's recent match ids, one for which of them we already have
+- The rest are fetched concurrently (at most BACKFILL_CONCURRENCY at a time), so a backfill takes about as long as its
+  slowest fetches instead of the sum of them, the upstream rate limiter still paces the requests
+- Fetched matches are stored as they arrive, BACKFILL_BATCH_SIZE per transaction (on the async engine with ASYNC_DB=true, see asyncdb.py)
+Run from server/: python backfill.py <puuid> [--limit N], or POST /backfill/<puuid>?limit=N
+'''
+
+class PlayerNotFound(Exception):
+    pass
+
+def recent_match_ids(puuid: str, limit: int) -> List[str]:
+    query = select(MMR_History.match_id).where(
+        MMR_History.puuid == puuid
+    ).order_by(desc(MMR_History.date), desc(MMR_History.id)).limit(limit)
+    return list(db.session.execute(query).scalars())
+
+def stored_match_ids(match_ids: List[str]) -> set:
+    if not match_ids:
+        return set()
+    query = select(Competitive_Match.match_id).where(
+        Competitive_Match.match_id.in_(match_ids)
+    )
+    return set(db.session.execute(query).scalars())
+
+# Store fetched matches in one transaction, a match someone else stored meanwhile only skips that match
+# (persist_match returns None for it, the savepoint covers dialects without ON CONFLICT)
+
+def _persist_batch(batch: List[Dict], summary: Dict, session):
+    for full_match_info in batch:
+        try:
+            with session.begin_nested():
+                stored = ingest.persist_match(full_match_info, session=session) is not None
+        except IntegrityError:
+            stored = False
+        summary['stored' if stored else 'already_stored'] += 1
+
+async def backfill_player_matches(puuid: str, limit: Optional[int] = None) -> Dict:
+    limit = limit or current_app.config['BACKFILL_MAX_MATCHES']
+    player = db.session.execute(select(Valorant_Player).where(Valorant_Player.puuid == puuid)).scalar_one_or_none()
+    if player is None:
+        raise PlayerNotFound(puuid)
+
+    match_ids = recent_match_ids(puuid, limit)
+    already_stored = stored_match_ids(match_ids)
+    missing = [match_id for match_id in match_ids if match_id not in already_stored]
+    region = player.region
+    # nothing below runs inside a transaction we opened, the batches each commit
+    db.session.commit()
+
+    summary = {'puuid': puuid, 'matches': len(match_ids), 'already_stored': len(already_stored), 'stored': 0, 'not_found': [], 'failed': []}
+    semaphore = asyncio.Semaphore(current_app.config['BACKFILL_CONCURRENCY'])
+
+    async def fetch(match_id):
+        async with semaphore:
+            try:
+                return match_id, await val.get_match_info(region, match_id)
+            except upstream.UpstreamUnavailable:
+                summary['failed'].append(match_id)
+                return match_id, None
+
+    batch = []
+    for fetched in asyncio.as_completed([fetch(match_id) for match_id in missing]):
+        match_id, full_match_info = await fetched
+        if full_match_info is None:
+            if match_id not in summary['failed']:
+                summary['not_found'].append(match_id)
+            continue
+
+        batch.append(full_match_info)
+        if len(batch) >= current_app.config['BACKFILL_BATCH_SIZE']:
+            await asyncdb.run_sync(_persist_batch, batch, summary)
+            batch = []
+
+    if batch:
+        await asyncdb.run_sync(_persist_batch, batch, summary)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch and store the matches in a player's mmr history that aren't stored yet")
+    parser.add_argument('puuid')
+    parser.add_argument('--limit', type=int, default=None, help='how many of their most recent matches to look at (default BACKFILL_MAX_MATCHES)')
+    args = parser.parse_args()
+
+    with upstream.background():
+        summary = asyncio.run(backfill_player_matches(args.puuid, args.limit))
+    print(f'{summary["stored"]} matches stored, {summary["already_stored"]} already stored, '
+          f'{len(summary["not_found"])} not found, {len(summary["failed"])} failed (of {summary["matches"]} in the mmr history)')
+
+if __name__ == '__main__':
+    from app import app
+    with app.app_context():
+        main()
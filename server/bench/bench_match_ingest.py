@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import argparse
+
+# never point a benchmark at the real database by accident, it only runs against BENCH_DB_URI
+os.environ['SUPABASE_DB_URI'] = os.getenv('BENCH_DB_URI', 'sqlite://')
+os.environ['CACHE_TYPE'] = 'SimpleCache'
+os.environ['ASSETS_REFRESH_SECONDS'] = '0'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import app
+from models import db, Competitive_Match, Competitive_Match_Player, Competitive_Match_Kill
+from bench.fixtures import fake_match_info
+import ingest
+
+'''
+Per-match ingest time of the old unit of work path (one ORM object per player/kill) vs ingest.persist_match
+Run from server/: python -m bench.bench_match_ingest --matches 200 --kills 150
+'''
+
+# What get_match_info_v2 used to do before ingest.persist_match
+
+def orm_persist_match(full_match_info):
+    new_match = Competitive_Match(**{column: full_match_info[column] for column in ingest.MATCH_COLUMNS})
+    db.session.add(new_match)
+    db.session.flush()
+
+    for player_info in full_match_info['match_players']:
+        db.session.add(Competitive_Match_Player(match_id=new_match.id, **{column: player_info[column] for column in ingest.MATCH_PLAYER_COLUMNS}))
+    for kill_info in full_match_info['match_kills']:
+        db.session.add(Competitive_Match_Kill(match_id=new_match.id, **{column: kill_info[column] for column in ingest.MATCH_KILL_COLUMNS}))
+    return new_match.id
+
+def run(label, persist, matches, kills):
+    payloads = [fake_match_info(f'{label}-{index}', kills=kills, seed=index) for index in range(matches)]
+
+    start = time.perf_counter()
+    for payload in payloads:
+        persist(payload)
+        db.session.commit()
+    elapsed = time.perf_counter() - start
+
+    print(f'{label:>8}: {elapsed / matches * 1000:.2f} ms/match ({matches} matches, {kills} kills each)')
+    return elapsed
+
+def cleanup():
+    is_bench_match = Competitive_Match.match_id.like('orm-%') | Competitive_Match.match_id.like('bulk-%')
+    bench_matches = db.session.query(Competitive_Match.id).filter(is_bench_match)
+    db.session.query(Competitive_Match_Kill).filter(Competitive_Match_Kill.match_id.in_(bench_matches)).delete(synchronize_session=False)
+    db.session.query(Competitive_Match_Player).filter(Competitive_Match_Player.match_id.in_(bench_matches)).delete(synchronize_session=False)
+    db.session.query(Competitive_Match).filter(is_bench_match).delete(synchronize_session=False)
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--matches', type=int, default=200)
+    parser.add_argument('--kills', type=int, default=150)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        try:
+            before = run('orm', orm_persist_match, args.matches, args.kills)
+            after = run('bulk', ingest.persist_match, args.matches, args.kills)
+            print(f' speedup: {before / after:.1f}x')
+        finally:
+            db.session.rollback()
+            cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import os
+import gc
+import sys
+import glob
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from bench.fixtures import fake_match_payload
+import codec
+import val
+
+'''
+Time spent on one match between the upstream response and our response: decode the v4 payload, parse it, encode what we send
+Each step is timed the old way (stdlib json, kill parser scanning all of player_locations) and the current way (codec.py, val.parse_kill)
+Run from server/: python -m bench.bench_match_parse --matches 50 --kills 200
+or on recorded payloads (v4 match responses saved as .json files): python -m bench.bench_match_parse --payloads <dir>
+'''
+
+# What val.get_match_info did per kill before val.parse_kill (kept to compare against)
+
+def old_parse_kills(kills):
+    kill_stats = []
+    for kill in kills:
+        kill_dict = {'time_in_round': kill['time_in_round_in_ms'], 'round': kill['round'], 'killer_puuid': kill['killer']['puuid'], 'victim_puuid': kill['victim']['puuid'],
+                     'victim_x': kill['location']['x'], 'victim_y': kill['location']['y'], 'weapon_id': kill['weapon']['id']}
+
+        for player in kill['player_locations']:
+            if player['player']['puuid'] == kill_dict['killer_puuid']:
+                kill_dict['killer_x'] = player['location']['x']
+                kill_dict['killer_y'] = player['location']['y']
+                kill_dict['killer_view'] = player['view_radians']
+
+        if not ('killer_x' in kill_dict):
+            if kill_dict['killer_puuid'] == kill_dict['victim_puuid']:
+                kill_dict['killer_x'] = kill_dict['victim_x']
+                kill_dict['killer_y'] = kill_dict['victim_y']
+            else:
+                kill_dict['killer_x'] = -100000
+                kill_dict['killer_y'] = -100000
+            kill_dict['killer_view'] = -1
+
+        assistants = []
+        for assistant in kill['assistants']:
+            assistants.append(assistant['puuid'])
+        kill_dict['assistants'] = assistants
+        kill_stats.append(kill_dict)
+    return kill_stats
+
+def load_payloads(directory, matches, kills):
+    if directory is None:
+        return [json.dumps(fake_match_payload(f'bench-{index}', kills=kills, seed=index)).encode() for index in range(matches)]
+
+    payloads = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        with open(path, 'rb') as file:
+            payloads.append(file.read())
+    return payloads
+
+# Best of `repeat` runs over all items, per item, with the gc off like timeit (the results are kept alive, collections would dominate)
+
+def timed(fn, items, repeat):
+    best = float('inf')
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = [fn(item) for item in items]
+            best = min(best, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return best / len(items), results
+
+def report(step, before, after):
+    print(f'{step:>7}: {before * 1000:7.3f} ms -> {after * 1000:7.3f} ms per match ({before / after:.1f}x)')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--matches', type=int, default=50)
+    parser.add_argument('--kills', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--payloads', default=None, help='directory of recorded v4 match responses (.json), instead of synthetic ones')
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads, args.matches, args.kills)
+    if not payloads:
+        sys.exit(f'no .json payloads in {args.payloads}')
+    print(f'{len(payloads)} matches, codec: {"orjson" if codec.orjson is not None else "stdlib json (orjson not installed)"}')
+
+    before, documents = timed(json.loads, payloads, args.repeat)
+    after, _ = timed(codec.loads, payloads, args.repeat)
+    report('decode', before, after)
+
+    kill_lists = [document['data']['kills'] for document in documents]
+    before, old_kills = timed(old_parse_kills, kill_lists, args.repeat)
+    after, new_kills = timed(lambda kills: [val.parse_kill(kill) for kill in kills], kill_lists, args.repeat)
+    assert old_kills == new_kills, 'val.parse_kill disagrees with the old parser'
+    report('kills', before, after)
+
+    matches = [val.parse_match(document['data']) for document in documents]
+    app = Flask(__name__)
+    default_provider, codec_provider = DefaultJSONProvider(app), codec.JSONProvider(app)
+    with app.app_context():
+        before, _ = timed(lambda match: default_provider.response(match).get_data(), matches, args.repeat)
+        after, _ = timed(lambda match: codec_provider.response(match).get_data(), matches, args.repeat)
+    report('encode', before, after)
+
+if __name__ == '__main__':
+    main()
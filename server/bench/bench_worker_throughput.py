@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import argparse
+
+# never point a benchmark at the real database by accident, it only runs against BENCH_DB_URI
+# (a file, not sqlite://, the sync and async engines have to see the same database)
+BENCH_DB_FILE = os.path.join(tempfile.gettempdir(), 'silverwolf-bench-worker.db')
+os.environ['SUPABASE_DB_URI'] = os.getenv('BENCH_DB_URI', f'sqlite:///{BENCH_DB_FILE}')
+os.environ['CACHE_TYPE'] = 'SimpleCache'
+os.environ['ASSETS_REFRESH_SECONDS'] = '0'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import select, func, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.util import await_only
+from app import app
+from models import db, Refresh_Job, Competitive_Match, Competitive_Match_Player, Competitive_Match_Kill, Player_Stats
+from bench.fixtures import fake_match_info
+import val
+import jobs
+import asyncdb
+import worker
+
+'''
+Worker throughput on match fetch jobs with a slow upstream, sync session vs the async engine (ASYNC_DB, see asyncdb.py)
+val.get_match_info is swapped for a fake that answers after --latency seconds, so no request leaves the machine
+Run from server/: python -m bench.bench_worker_throughput --jobs 200 --latency 0.2 --concurrency 8 --db-latency 0.02
+sqlite by default, which has no network round trips, --db-latency adds one per statement the way a driver waits on the network:
+blocking the thread on the sync engine, awaited on the async one. Or set BENCH_DB_URI to a postgres database for real ones
+'''
+
+def slow_upstream(latency, kills):
+    async def get_match_info(region, match_id):
+        await asyncio.sleep(latency)
+        return fake_match_info(match_id, kills=kills, seed=hash(match_id) % 1000, region=region)
+    return get_match_info
+
+def add_db_latency(latency):
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def round_trip(conn, cursor, statement, parameters, context, executemany):
+        if conn.dialect.is_async:
+            await_only(asyncio.sleep(latency))
+        else:
+            time.sleep(latency)
+
+def cleanup():
+    bench_matches = select(Competitive_Match.id).where(Competitive_Match.match_id.like('bench-worker-%'))
+    bench_players = select(Competitive_Match_Player.puuid).where(Competitive_Match_Player.match_id.in_(bench_matches))
+    db.session.query(Player_Stats).filter(Player_Stats.puuid.in_(bench_players)).delete(synchronize_session=False)
+    db.session.query(Competitive_Match_Kill).filter(Competitive_Match_Kill.match_id.in_(bench_matches)).delete(synchronize_session=False)
+    db.session.query(Competitive_Match_Player).filter(Competitive_Match_Player.match_id.in_(bench_matches)).delete(synchronize_session=False)
+    db.session.query(Competitive_Match).filter(Competitive_Match.match_id.like('bench-worker-%')).delete(synchronize_session=False)
+    db.session.query(Refresh_Job).filter(Refresh_Job.key.like('bench-worker-%')).delete(synchronize_session=False)
+    db.session.commit()
+
+def reset(job_count):
+    cleanup()
+    for index in range(job_count):
+        jobs.enqueue_match_fetch('NA', f'bench-worker-{index}')
+    db.session.commit()
+
+def run(label, async_db, job_count):
+    app.config['ASYNC_DB'] = async_db
+    asyncdb.init_app(app)
+    reset(job_count)
+
+    start = time.perf_counter()
+    asyncio.run(worker.main(drain=True))
+    elapsed = time.perf_counter() - start
+
+    stored = db.session.execute(select(func.count(Competitive_Match.id)).where(Competitive_Match.match_id.like('bench-worker-%'))).scalar()
+    left = db.session.execute(select(func.count(Refresh_Job.id)).where(Refresh_Job.key.like('bench-worker-%'))).scalar()
+    db.session.commit()
+    assert stored == job_count and left == 0, f'{label}: {stored}/{job_count} matches stored, {left} jobs left'
+
+    print(f'{label:>6}: {elapsed:.2f}s, {job_count / elapsed:.1f} jobs/s')
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds the fake upstream takes per match')
+    parser.add_argument('--kills', type=int, default=150)
+    parser.add_argument('--concurrency', type=int, default=8, help='WORKER_CONCURRENCY')
+    parser.add_argument('--db-latency', type=float, default=0, help='seconds of simulated network round trip per statement')
+    args = parser.parse_args()
+
+    val.get_match_info = slow_upstream(args.latency, args.kills)
+    app.config.update(WORKER_CONCURRENCY=args.concurrency, WORKER_POLL_INTERVAL=0.01)
+
+    with app.app_context():
+        print(f'{args.jobs} match jobs, {args.concurrency} slots, upstream latency {args.latency * 1000:.0f} ms, '
+              f'{db.engine.url.get_backend_name()} + {args.db_latency * 1000:.0f} ms per statement')
+        db.create_all()
+        if args.db_latency:
+            add_db_latency(args.db_latency)
+        try:
+            before = run('sync', False, args.jobs)
+            after = run('async', True, args.jobs)
+            print(f'speedup: {before / after:.2f}x (the upstream alone takes {args.jobs * args.latency / args.concurrency:.2f}s at this concurrency)')
+        finally:
+            db.session.rollback()
+            cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+
+# never point a benchmark at the real database by accident, it only runs against BENCH_DB_URI
+os.environ['SUPABASE_DB_URI'] = os.getenv('BENCH_DB_URI', 'sqlite://')
+os.environ['CACHE_TYPE'] = 'SimpleCache'
+os.environ['ASSETS_REFRESH_SECONDS'] = '0'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import event
+from app import app, cache
+from models import db, Valorant_Player
+from bench.check_query_counts import seed_player
+import ingest
+import pagination
+
+'''
+Fails (exit 1) if a query run by a hot route still needs a sequential scan of one of our tables
+Every SELECT a route runs is captured and EXPLAINed on the same database
+- postgres: EXPLAIN (FORMAT JSON) with enable_seqscan off, a Seq Scan is left in the plan only when no index can serve the query
+- sqlite: EXPLAIN QUERY PLAN, a SCAN that isn't USING an index is a full table scan (unless it's an unfiltered, unsorted LIMIT)
+Run from server/: python -m bench.check_indexes (BENCH_DB_URI=postgresql://... to check against postgres, after `alembic upgrade head`)
+'''
+
+# the {name}/{tag}/{puuid}/{match_id} are filled in for the seeded player, {user_cursor}/{mmr_cursor}/{match_cursor} point into a second page
+
+ROUTES = [
+    '/users',
+    '/users?cursor={user_cursor}',
+    '/users/{name}/{tag}',
+    '/by-puuid/users/{puuid}',
+    '/mmr-history/{name}/{tag}',
+    '/by-puuid/mmr-history/{puuid}',
+    '/mmr-history',
+    '/mmr-history?cursor={mmr_cursor}',
+    '/match/NA/{match_id}',
+    '/by-puuid/match-history/{puuid}',
+    '/by-puuid/match-history/{puuid}?cursor={match_cursor}',
+    '/match-history/{name}/{tag}',
+    '/match-history/{name}/{tag}?map=Ascent',
+    '/stats/{puuid}',
+    '/heatmap/Ascent',
+    '/heatmap/Ascent?puuid={puuid}&agent=Jett'
+]
+
+def seed_mmr_history(puuid, count):
+    ingest.ingest_mmr_history(puuid, [
+        {'match_id': f'mmr-{puuid}-{index}', 'mmr_change': 10, 'refunded_rr': 0, 'was_derank_protected': 0, 'map': 'Ascent',
+         'account_rank': 'Gold 1', 'account_rr': 50, 'account_rank_img': 'None', 'date': 1700000000 + index}
+        for index in range(count)
+    ])
+
+def capture_selects(client, url):
+    statements = []
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        cache.clear()
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert response.status_code == 200, f'{url} returned {response.status_code}'
+    return statements
+
+def _postgres_seq_scans(plan):
+    scans = [plan['Relation Name']] if plan.get('Node Type') == 'Seq Scan' else []
+    for child in plan.get('Plans', []):
+        scans += _postgres_seq_scans(child)
+    return scans
+
+# Tables the statement has to scan in full
+
+def full_scans(connection, statement, parameters):
+    if connection.dialect.name == 'postgresql':
+        plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return _postgres_seq_scans(plan[0]['Plan'])
+
+    details = [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+    # sqlite says SCAN for a walk in primary key order too, with nothing filtered and no sort that stops after LIMIT rows
+    # (the first page of a keyset paginated table, postgres shows it as an index scan)
+    words = statement.upper().split()
+    if 'WHERE' not in words and 'LIMIT' in words and not any('TEMP B-TREE' in detail for detail in details):
+        return []
+    return [detail.split()[1] for detail in details if detail.startswith('SCAN ') and ' USING ' not in detail]
+
+def main():
+    failed = False
+    with app.app_context():
+        db.create_all()
+        player = seed_player(1, 50)
+        seed_mmr_history(player['puuid'], 100)
+        # fresh, so the player routes don't queue refreshes
+        Valorant_Player.query.filter_by(puuid=player['puuid']).update({'last_refreshed_at': int(time.time())})
+        db.session.commit()
+
+        player['user_cursor'] = pagination.encode_cursor([1])
+        player['mmr_cursor'] = pagination.encode_cursor([1700000050, 50])
+        player['match_cursor'] = pagination.encode_cursor([1700000025, 25])
+
+        client = app.test_client()
+        with db.engine.connect() as connection:
+            if connection.dialect.name == 'postgresql':
+                connection.exec_driver_sql('SET enable_seqscan = off')
+
+            for route in ROUTES:
+                url = route.format(**player)
+                for statement, parameters in capture_selects(client, url):
+                    scans = full_scans(connection, statement, parameters)
+                    failed = failed or bool(scans)
+                    status = 'FAIL' if scans else 'ok'
+                    print(f'{status:>4} {url} {" ".join(statement.split())[:100]}' + (f' (scans {", ".join(scans)})' if scans else ''))
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
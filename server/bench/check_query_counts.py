@@ -0,0 +1,79 @@
+import os
+import sys
+import random
+
+# never point a benchmark at the real database by accident, it only runs against BENCH_DB_URI
+os.environ['SUPABASE_DB_URI'] = os.getenv('BENCH_DB_URI', 'sqlite://')
+os.environ['CACHE_TYPE'] = 'SimpleCache'
+os.environ['ASSETS_REFRESH_SECONDS'] = '0'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import event
+from app import app, cache
+from models import db, Valorant_Player
+from bench.fixtures import fake_match_info, fake_puuid
+import ingest
+
+'''
+Fails (exit 1) if a DB backed route's query count grows with the amount of stored data (N+1 regressions)
+Each route is called for a player with 1 stored match and a player with 50, both must cost the same fixed number of queries
+Run from server/: python -m bench.check_query_counts
+'''
+
+# route -> queries it is allowed to run, the {name}/{tag}/{puuid}/{match_id} are filled in per seeded player
+
+EXPECTED_QUERY_COUNTS = {
+    '/match/NA/{match_id}': 3,
+    '/by-puuid/match-history/{puuid}': 4,
+    '/match-history/{name}/{tag}': 4,
+    # scoreboard only, the kills are never queried
+    '/match/NA/{match_id}?include=players': 2,
+    '/match-history/{name}/{tag}?include=players': 3,
+    '/by-puuid/match-history/{puuid}?fields=match_id,map,who_won': 2
+}
+
+def seed_player(index, match_count):
+    rng = random.Random(index)
+    puuid = fake_puuid(rng)
+    db.session.add(Valorant_Player(puuid=puuid, name=f'check{index}', tag='0000', region='NA', account_level=1, card='None', title='None'))
+
+    match_ids = []
+    for match_index in range(match_count):
+        puuids = [puuid] + [fake_puuid(rng) for _ in range(9)]
+        match_id = f'check-{index}-{match_index}'
+        ingest.persist_match(fake_match_info(match_id, kills=40, seed=match_index, puuids=puuids, game_start=1700000000 + match_index))
+        match_ids.append(match_id)
+    db.session.commit()
+    return {'puuid': puuid, 'name': f'check{index}', 'tag': '0000', 'match_id': match_ids[0]}
+
+def count_queries(client, url):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        cache.clear()
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert response.status_code == 200, f'{url} returned {response.status_code}'
+    return len(statements)
+
+def main():
+    failed = False
+    with app.app_context():
+        db.create_all()
+        players = [seed_player(1, 1), seed_player(2, 50)]
+
+        client = app.test_client()
+        for route, expected in EXPECTED_QUERY_COUNTS.items():
+            for player in players:
+                url = route.format(**player)
+                queries = count_queries(client, url)
+                status = 'ok' if queries <= expected else 'FAIL'
+                failed = failed or queries > expected
+                print(f'{status:>4} {queries:>3} queries (max {expected}) {url}')
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import uuid
+import zlib
+import random
+
+'''
+Synthetic data shaped like what val.py hands to the rest of the server, for the benchmarks in this folder
+'''
+
+AGENTS = ['Jett', 'Reyna', 'Sova', 'Omen', 'Killjoy', 'Sage', 'Raze', 'Cypher', 'Breach', 'Viper', 'Skye', 'Fade']
+MAPS = ['Ascent', 'Bind', 'Haven', 'Split', 'Lotus', 'Sunset', 'Icebox']
+WEAPONS = ['9c82e19d-4575-0200-1a81-3eacf00cf872', 'ee8e8d15-496b-07ac-e5f6-8fae5d4c7b1a', 'a03b24d3-4319-996d-0f8c-94bbfba1dfc7']
+
+# Identities shared by the seeder, the upstream stub and the load test (bench/seed.py, bench/stub_henrik.py, bench/load_test.py)
+# so a seeded player looks the same to the server whether it comes from the database or from "upstream"
+
+BENCH_NAMESPACE = uuid.UUID('6f1c1a52-8a8e-4c55-9f5e-2d0b7a3c9e41')
+BENCH_TAG = 'BNCH'
+
+def bench_player(index: int, region: str = 'na') -> dict:
+    return {'puuid': str(uuid.uuid5(BENCH_NAMESPACE, f'player/{index}')), 'name': f'bench{index}', 'tag': BENCH_TAG, 'region': region}
+
+def bench_match_id(index: int) -> str:
+    return str(uuid.uuid5(BENCH_NAMESPACE, f'match/{index}'))
+
+# hash() is salted per process, this is the same everywhere
+def stable_seed(text: str) -> int:
+    return zlib.crc32(text.encode())
+
+def fake_puuid(rng: random.Random) -> str:
+    hex_digits = '%032x' % rng.getrandbits(128)
+    return f'{hex_digits[:8]}-{hex_digits[8:12]}-{hex_digits[12:16]}-{hex_digits[16:20]}-{hex_digits[20:]}'
+
+# A match in the format val.get_match_info returns
+
+def fake_match_info(match_id: str, kills: int = 150, seed: int = 0, puuids=None, game_start: int = 1700000000, region: str = 'NA') -> dict:
+    rng = random.Random(seed)
+    puuids = puuids or [fake_puuid(rng) for _ in range(10)]
+
+    players = []
+    for index, puuid in enumerate(puuids):
+        players.append({'puuid': puuid, 'agent': rng.choice(AGENTS), 'party_id': fake_puuid(rng), 'team': 'red' if index < 5 else 'blue',
+                        'name': f'player{index}', 'tag': f'{index:04d}',
+                        'score': rng.randint(1000, 8000), 'kills': rng.randint(0, 30), 'deaths': rng.randint(0, 25), 'assists': rng.randint(0, 15),
+                        'headshots': rng.randint(0, 40), 'bodyshots': rng.randint(0, 120), 'legshots': rng.randint(0, 20),
+                        'damage_dealt': rng.randint(500, 5000), 'damage_received': rng.randint(500, 5000),
+                        'c_ability': rng.randint(0, 20), 'e_ability': rng.randint(0, 20), 'q_ability': rng.randint(0, 20), 'x_ability': rng.randint(0, 5)})
+
+    kill_stats = []
+    for index in range(kills):
+        killer, victim = rng.sample(puuids, 2)
+        kill_stats.append({'time_in_round': rng.randint(0, 100000), 'round': index // 7, 'killer_puuid': killer, 'victim_puuid': victim,
+                           'killer_x': rng.randint(-8000, 8000), 'killer_y': rng.randint(-8000, 8000),
+                           'victim_x': rng.randint(-8000, 8000), 'victim_y': rng.randint(-8000, 8000),
+                           'killer_view': rng.random() * 6.28, 'weapon_id': rng.choice(WEAPONS),
+                           'assistants': rng.sample(puuids, rng.randint(0, 2))})
+
+    red_score = rng.randint(0, 13)
+    blue_score = 13 if red_score < 13 else rng.randint(0, 11)
+    return {'match_id': match_id, 'map': rng.choice(MAPS), 'game_length': rng.randint(1500000, 3000000), 'game_start': game_start,
+            'region': region, 'server': 'Virginia', 'red_score': red_score, 'blue_score': blue_score,
+            'who_won': 'red' if red_score > blue_score else 'blue',
+            'match_players': players, 'match_kills': kill_stats}
+
+# A henrikdev v4 match response ({'data': ...}), what val.get_match_info gets from upstream
+# Kills carry a player_locations snapshot of everyone alive, killer usually somewhere in it, sometimes not (died first)
+# known_players ({'puuid', 'name', 'tag'}) take the first seats, the rest are made up
+
+def fake_match_payload(match_id: str, kills: int = 150, seed: int = 0, region: str = 'na', known_players=()) -> dict:
+    rng = random.Random(seed)
+    identities = [{'puuid': fake_puuid(rng), 'name': f'player{index}', 'tag': f'{index:04d}'} for index in range(10)]
+    identities[:len(known_players)] = [{key: player[key] for key in ('puuid', 'name', 'tag')} for player in known_players[:10]]
+    puuids = [identity['puuid'] for identity in identities]
+
+    players = []
+    for index, identity in enumerate(identities):
+        players.append({**identity, 'team_id': 'Red' if index < 5 else 'Blue',
+                        'party_id': fake_puuid(rng), 'agent': {'id': fake_puuid(rng), 'name': rng.choice(AGENTS)},
+                        'stats': {'score': rng.randint(1000, 8000), 'kills': rng.randint(0, 30), 'deaths': rng.randint(0, 25), 'assists': rng.randint(0, 15),
+                                  'headshots': rng.randint(0, 40), 'bodyshots': rng.randint(0, 120), 'legshots': rng.randint(0, 20),
+                                  'damage': {'dealt': rng.randint(500, 5000), 'received': rng.randint(500, 5000)}},
+                        'ability_casts': {'grenade': rng.randint(0, 20), 'ability1': rng.randint(0, 20), 'ability2': rng.randint(0, 20), 'ultimate': rng.randint(0, 5)}})
+
+    kill_list = []
+    for index in range(kills):
+        killer, victim = rng.sample(puuids, 2)
+        alive = [puuid for puuid in puuids if puuid != victim and (puuid != killer or rng.random() > 0.05)]
+        rng.shuffle(alive)
+        kill_list.append({'time_in_round_in_ms': rng.randint(0, 100000), 'round': index // 7,
+                          'killer': {'puuid': killer, 'name': 'killer', 'tag': '0000', 'team': 'Red'},
+                          'victim': {'puuid': victim, 'name': 'victim', 'tag': '0000', 'team': 'Blue'},
+                          'assistants': [{'puuid': puuid, 'name': 'assistant', 'tag': '0000', 'team': 'Red'} for puuid in rng.sample(puuids, rng.randint(0, 2))],
+                          'location': {'x': rng.randint(-8000, 8000), 'y': rng.randint(-8000, 8000)},
+                          'weapon': {'id': rng.choice(WEAPONS), 'name': 'Vandal', 'type': 'Weapon'},
+                          'secondary_fire_mode': False,
+                          'player_locations': [{'player': {'puuid': puuid, 'name': 'player', 'tag': '0000', 'team': 'Red'},
+                                                'view_radians': rng.random() * 6.28,
+                                                'location': {'x': rng.randint(-8000, 8000), 'y': rng.randint(-8000, 8000)}} for puuid in alive]})
+
+    red_rounds = rng.randint(0, 13)
+    blue_rounds = 13 if red_rounds < 13 else rng.randint(0, 11)
+    return {'status': 200, 'data': {
+        'metadata': {'match_id': match_id, 'map': {'id': fake_puuid(rng), 'name': rng.choice(MAPS)}, 'game_length_in_ms': rng.randint(1500000, 3000000),
+                     'started_at': '2024-05-01T18:30:00.000Z', 'region': region, 'cluster': 'Virginia', 'queue': {'id': 'competitive'}},
+        'teams': [{'team_id': 'Red', 'rounds': {'won': red_rounds, 'lost': blue_rounds}, 'won': red_rounds > blue_rounds},
+                  {'team_id': 'Blue', 'rounds': {'won': blue_rounds, 'lost': red_rounds}, 'won': blue_rounds > red_rounds}],
+        'players': players,
+        'kills': kill_list
+    }}
+
+# A henrikdev v2 account response (both /account/<name>/<tag> and /by-puuid/account/<puuid>)
+
+def fake_account_payload(puuid: str, name: str, tag: str, region: str = 'na', seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {'status': 200, 'data': {'puuid': puuid, 'region': region, 'account_level': rng.randint(1, 400), 'name': name, 'tag': tag,
+                                    'card': fake_puuid(rng), 'title': fake_puuid(rng), 'platforms': ['PC'], 'updated_at': '2024-05-01T18:30:00.000Z'}}
+
+TIERS = ['Iron 1', 'Iron 2', 'Iron 3', 'Bronze 1', 'Bronze 2', 'Bronze 3', 'Silver 1', 'Silver 2', 'Silver 3', 'Gold 1', 'Gold 2', 'Gold 3',
+         'Platinum 1', 'Platinum 2', 'Platinum 3', 'Diamond 1', 'Diamond 2', 'Diamond 3', 'Ascendant 1', 'Ascendant 2', 'Ascendant 3',
+         'Immortal 1', 'Immortal 2', 'Immortal 3', 'Radiant']
+
+# A henrikdev v2 mmr history entry, one per match id (newest first)
+
+def _fake_mmr_entries(match_ids, rng: random.Random) -> list:
+    entries = []
+    for index, match_id in enumerate(match_ids):
+        tier = rng.randrange(len(TIERS))
+        entries.append({'match_id': match_id, 'tier': {'id': tier + 3, 'name': TIERS[tier]}, 'map': {'id': fake_puuid(rng), 'name': rng.choice(MAPS)},
+                        'season': {'id': fake_puuid(rng), 'short': 'e9a1'}, 'rr': rng.randint(0, 99), 'last_change': rng.randint(-25, 25),
+                        'elo': rng.randint(0, 2500), 'refunded_rr': 0, 'was_derank_protected': False,
+                        'date': f'2024-05-{28 - index % 28:02d}T18:30:00.000Z'})
+    return entries
+
+# /v2/mmr-history and /v2/by-puuid/mmr-history ({'data': {'history': [...]}}), up to 20 matches like the real one
+
+def fake_mmr_history_payload(puuid: str, name: str, tag: str, match_ids, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {'status': 200, 'data': {'account': {'puuid': puuid, 'name': name, 'tag': tag}, 'history': _fake_mmr_entries(list(match_ids)[:20], rng)}}
+
+# /v2/by-puuid/stored-mmr-history ({'results': ..., 'data': [...]}), everything we'd have stored
+
+def fake_stored_mmr_history_payload(match_ids, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    entries = _fake_mmr_entries(list(match_ids), rng)
+    return {'status': 200, 'results': {'total': len(entries), 'returned': len(entries), 'before': 0, 'after': 0}, 'data': entries}
+
+# valorant-api.com asset lists (see assets.py), one tier table per episode
+
+def fake_assets_payloads(seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    tier_tables = [{'uuid': fake_puuid(rng), 'assetObjectName': f'Episode{episode}_CompetitiveTierDataTable',
+                    'tiers': [{'tier': tier, 'tierName': name.upper(), 'largeIcon': f'https://media.valorant-api.com/competitivetiers/{episode}/{tier}/largeicon.png'}
+                              for tier, name in enumerate(['Unranked', 'Unused1', 'Unused2'] + TIERS)]}
+                   for episode in range(1, 6)]
+    return {
+        'competitivetiers': {'status': 200, 'data': tier_tables},
+        'playertitles': {'status': 200, 'data': [{'uuid': fake_puuid(rng), 'titleText': f'Title {index}'} for index in range(200)]},
+        'playercards': {'status': 200, 'data': [{'uuid': fake_puuid(rng), 'smallArt': f'https://media.valorant-api.com/playercards/{index}/smallart.png'} for index in range(200)]}
+    }
@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import tempfile
+import argparse
+import collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import aiohttp
+from sqlalchemy import create_engine, select, func
+
+from models import Valorant_Player, Competitive_Match, Competitive_Match_Player
+from bench.fixtures import MAPS
+
+'''
+Load test against a running server: every route under concurrent load, p50/p95/p99 latency and throughput per route
+- Ids come from the benchmark database (bench/seed.py, BENCH_DB_URI), so requests hit players and matches that exist
+- Closed loop: --concurrency clients each send a request as soon as their last one is answered, the route is picked at random
+- The cold_* routes ask for players/matches nobody has stored, so the server goes to upstream (bench/stub_henrik.py) and writes them,
+  they and the parquet export are only sent when named in --routes (or --routes all), since they change the database
+- --output saves the results as JSON, --baseline compares against a saved run and exits 1 if a route's p95 got more than
+  --max-regression slower (and at least --noise-ms), the overall throughput dropped by as much, or errors went up, so it can gate a change.
+  Routes need --min-requests in both runs to be compared, run long enough for that (a minute or more with every route)
+Run from server/: python -m bench.load_test --url http://127.0.0.1:8000 --concurrency 32 --duration 60 --output before.json
+bench/run_load.py starts the stub and the server around it
+'''
+
+BENCH_DB_FILE = os.path.join(tempfile.gettempdir(), 'silverwolf-bench.db')
+
+class Samples:
+    def __init__(self, players, matches):
+        self.players = players    # (puuid, name, tag) of players with stored matches
+        self.matches = matches    # (region, match_id)
+
+    def player(self, rng):
+        return rng.choice(self.players)
+
+    def match(self, rng):
+        return rng.choice(self.matches)
+
+def load_samples(uri: str, count: int) -> Samples:
+    engine = create_engine(uri)
+    with engine.connect() as connection:
+        players = connection.execute(
+            select(Valorant_Player.puuid, Valorant_Player.name, Valorant_Player.tag)
+            .where(Valorant_Player.puuid.in_(select(Competitive_Match_Player.puuid)))
+            .order_by(func.random()).limit(count)
+        ).all()
+        matches = connection.execute(
+            select(Competitive_Match.region, Competitive_Match.match_id).order_by(func.random()).limit(count)
+        ).all()
+    engine.dispose()
+    if not players or not matches:
+        sys.exit(f'No players/matches in {uri}, run python -m bench.seed first')
+    return Samples(players, matches)
+
+# Route name -> how to build a request for it: (method, path, json body)
+
+def _batch(samples, rng):
+    return 'POST', '/users/batch', {'players': [player[0] for player in rng.sample(samples.players, min(20, len(samples.players)))]}
+
+ROUTES = {
+    'user_by_name': lambda samples, rng: ('GET', '/users/{1}/{2}'.format(*samples.player(rng)), None),
+    'user_by_puuid': lambda samples, rng: ('GET', f'/by-puuid/users/{samples.player(rng)[0]}', None),
+    'users_batch': _batch,
+    'users_page': lambda samples, rng: ('GET', '/users', None),
+    'mmr_history_by_name': lambda samples, rng: ('GET', '/mmr-history/{1}/{2}'.format(*samples.player(rng)), None),
+    'mmr_history_by_puuid': lambda samples, rng: ('GET', f'/by-puuid/mmr-history/{samples.player(rng)[0]}', None),
+    'mmr_history_page': lambda samples, rng: ('GET', '/mmr-history', None),
+    'match': lambda samples, rng: ('GET', '/match/{0}/{1}'.format(*samples.match(rng)), None),
+    'match_history_by_name': lambda samples, rng: ('GET', '/match-history/{1}/{2}'.format(*samples.player(rng)), None),
+    'match_history_by_puuid': lambda samples, rng: ('GET', f'/by-puuid/match-history/{samples.player(rng)[0]}', None),
+    'stats': lambda samples, rng: ('GET', f'/stats/{samples.player(rng)[0]}', None),
+    'heatmap': lambda samples, rng: ('GET', f'/heatmap/{rng.choice(MAPS)}', None),
+    'cold_user': lambda samples, rng: ('GET', f'/by-puuid/users/{uuid.UUID(int=rng.getrandbits(128), version=4)}', None),
+    'cold_match': lambda samples, rng: ('GET', f'/match/na/{uuid.UUID(int=rng.getrandbits(128), version=4)}', None),
+    'export': lambda samples, rng: ('GET', '/export/competitive_match_kills.parquet', None)
+}
+
+# changes the database or is too heavy to mix in by default
+OPT_IN_ROUTES = {'cold_user', 'cold_match', 'export'}
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+class Recorder:
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.statuses = collections.defaultdict(collections.Counter)
+
+    def record(self, route: str, status, seconds: float):
+        self.latencies[route].append(seconds)
+        self.statuses[route][str(status)] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            errors = sum(count for status, count in self.statuses[route].items() if not status.isdigit() or int(status) >= 500)
+            routes[route] = {
+                'requests': len(latencies),
+                'errors': errors,
+                'statuses': dict(self.statuses[route]),
+                'rps': len(latencies) / elapsed,
+                'p50_ms': percentile(latencies, 0.50) * 1000,
+                'p95_ms': percentile(latencies, 0.95) * 1000,
+                'p99_ms': percentile(latencies, 0.99) * 1000
+            }
+        every = sorted(latency for latencies in self.latencies.values() for latency in latencies)
+        total = {
+            'requests': len(every),
+            'errors': sum(route['errors'] for route in routes.values()),
+            'rps': len(every) / elapsed,
+            'p50_ms': percentile(every, 0.50) * 1000,
+            'p95_ms': percentile(every, 0.95) * 1000,
+            'p99_ms': percentile(every, 0.99) * 1000
+        }
+        return {'routes': routes, 'total': total}
+
+async def client(session, base_url, routes, samples, rng, recorder, warmup_until, stop_at, budget):
+    while time.monotonic() < stop_at and budget[0] > 0:
+        route = rng.choice(routes)
+        method, path, body = ROUTES[route](samples, rng)
+        start = time.monotonic()
+        try:
+            async with session.request(method, base_url + path, json=body) as response:
+                await response.read()
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            status = type(error).__name__
+        if start >= warmup_until:
+            recorder.record(route, status, time.monotonic() - start)
+            budget[0] -= 1
+
+async def run(args, routes, samples) -> dict:
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    # compressed like a browser would ask for it, so the server does the work it does in production
+    headers = {'Accept-Encoding': 'gzip, br, zstd'}
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers, auto_decompress=False) as session:
+        start = time.monotonic()
+        warmup_until = start + args.warmup
+        stop_at = warmup_until + args.duration if not args.requests else float('inf')
+        budget = [args.requests or float('inf')]
+        await asyncio.gather(*[client(session, args.url.rstrip('/'), routes, samples, random.Random(rng.getrandbits(64)), recorder,
+                                      warmup_until, stop_at, budget) for _ in range(args.concurrency)])
+        elapsed = time.monotonic() - warmup_until
+
+    results = recorder.summary(elapsed)
+    results['config'] = {'url': args.url, 'concurrency': args.concurrency, 'duration': elapsed, 'warmup': args.warmup, 'routes': routes, 'seed': args.seed}
+    return results
+
+def print_results(results: dict):
+    print(f'{"route":<24}{"requests":>10}{"errors":>8}{"req/s":>9}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for route, stats in list(results['routes'].items()) + [('total', results['total'])]:
+        print(f'{route:<24}{stats["requests"]:>10}{stats["errors"]:>8}{stats["rps"]:>9.1f}{stats["p50_ms"]:>10.1f}{stats["p95_ms"]:>10.1f}{stats["p99_ms"]:>10.1f}')
+
+# What got worse than the baseline run, empty if nothing did
+
+def compare(results: dict, baseline: dict, max_regression: float, noise_ms: float, min_requests: int):
+    regressions = []
+    for route, stats in results['routes'].items():
+        before = baseline['routes'].get(route)
+        # a p95 over a handful of requests is noise
+        if before is None or min(stats['requests'], before['requests']) < min_requests:
+            continue
+        if stats['p95_ms'] > before['p95_ms'] * (1 + max_regression) and stats['p95_ms'] - before['p95_ms'] > noise_ms:
+            regressions.append(f'{route}: p95 {before["p95_ms"]:.1f} -> {stats["p95_ms"]:.1f} ms')
+        if stats['errors'] / stats['requests'] > before['errors'] / max(before['requests'], 1) + 0.01:
+            regressions.append(f'{route}: errors {before["errors"]}/{before["requests"]} -> {stats["errors"]}/{stats["requests"]}')
+    if results['total']['rps'] < baseline['total']['rps'] * (1 - max_regression):
+        regressions.append(f'throughput: {baseline["total"]["rps"]:.1f} -> {results["total"]["rps"]:.1f} req/s')
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--db', default=os.getenv('BENCH_DB_URI', f'sqlite:///{BENCH_DB_FILE}'), help='database to sample ids from')
+    parser.add_argument('--routes', default='', help=f'comma separated, "all" or empty for every route but {", ".join(sorted(OPT_IN_ROUTES))}')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=60, help='seconds to measure for')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many measured requests instead')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds of unmeasured load first')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--samples', type=int, default=2000, help='players/matches to pick requests from')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results here as JSON')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='allowed p95/throughput change against --baseline')
+    parser.add_argument('--noise-ms', type=float, default=2, help='p95 changes smaller than this never count')
+    parser.add_argument('--min-requests', type=int, default=200, help='routes with fewer requests than this in either run are not compared')
+    args = parser.parse_args(argv)
+
+    if args.routes in ('', 'default'):
+        args.route_list = [route for route in ROUTES if route not in OPT_IN_ROUTES]
+    elif args.routes == 'all':
+        args.route_list = list(ROUTES)
+    else:
+        args.route_list = args.routes.split(',')
+        unknown = [route for route in args.route_list if route not in ROUTES]
+        if unknown:
+            parser.error(f'unknown routes {unknown}, pick from {", ".join(ROUTES)}')
+    return args
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    samples = load_samples(args.db, args.samples)
+    print(f'{args.url}: {args.concurrency} clients, {len(args.route_list)} routes, {args.warmup:.0f}s warmup + '
+          f'{f"{args.requests} requests" if args.requests else f"{args.duration:.0f}s"}')
+
+    results = asyncio.run(run(args, args.route_list, samples))
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.max_regression, args.noise_ms, args.min_requests)
+        if regressions:
+            print('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+            return 1
+        print(f'No regressions against {args.baseline}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+import urllib.request
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, SERVER_DIR)
+
+from bench import load_test
+
+'''
+One reproducible load test run: the upstream stub, the server under gunicorn pointed at it and the benchmark database, then
+bench/load_test.py against it, and everything torn down again
+- Seed the database first (python -m bench.seed), the server only ever sees BENCH_DB_URI
+- The server starts with an empty response cache and asset snapshot, so every run starts from the same state
+- Options it doesn't know are handed to bench/load_test.py (--concurrency, --duration, --routes, --output, --baseline, ...)
+Run from server/: python -m bench.run_load --workers 4 --latency 0.15 --duration 60 --output before.json
+then after a change: python -m bench.run_load --workers 4 --latency 0.15 --duration 60 --baseline before.json (exits 1 on a regression)
+'''
+
+BENCH_DIR = os.path.join(tempfile.gettempdir(), 'silverwolf-bench')
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f'{" ".join(process.args)} exited with {process.returncode}')
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit(f'{url} did not come up in {timeout:.0f}s')
+
+def stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def server_env(args, stub_url: str) -> dict:
+    shutil.rmtree(BENCH_DIR, ignore_errors=True)
+    os.makedirs(BENCH_DIR)
+    env = dict(os.environ)
+    env.update({
+        'SUPABASE_DB_URI': args.db,
+        'HENRIK_API_URL': stub_url,
+        'VALORANT_API_URL': stub_url,
+        'CACHE_TYPE': args.cache,
+        'CACHE_DIR': os.path.join(BENCH_DIR, 'cache'),
+        'ASSETS_SNAPSHOT_PATH': os.path.join(BENCH_DIR, 'assets.json'),
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(BENCH_DIR, 'metrics'),
+        # the stub's --rate-limit is the quota, the server paces itself by its headers like it does against henrikdev
+        'UPSTREAM_RATE_LIMIT': str(args.upstream_rate_limit),
+        'UPSTREAM_RATE_WINDOW': '60'
+    })
+    return env
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default=os.getenv('BENCH_DB_URI', f'sqlite:///{load_test.BENCH_DB_FILE}'))
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--cache', default='FileSystemCache', help='CACHE_TYPE for the server, NullCache to measure uncached responses')
+    parser.add_argument('--upstream-rate-limit', type=int, default=100000, help='UPSTREAM_RATE_LIMIT per minute for the server')
+    parser.add_argument('--stub-port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.15, help='stub latency, see bench/stub_henrik.py')
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--rate-limit', type=int, default=0)
+    parser.add_argument('--recordings')
+    args, load_test_args = parser.parse_known_args()
+
+    stub_url = f'http://127.0.0.1:{args.stub_port}'
+    server_url = f'http://127.0.0.1:{args.port}'
+    stub_command = [sys.executable, '-m', 'bench.stub_henrik', '--port', str(args.stub_port), '--latency', str(args.latency),
+                    '--jitter', str(args.jitter), '--error-rate', str(args.error_rate), '--rate-limit', str(args.rate_limit)]
+    if args.recordings:
+        stub_command += ['--recordings', args.recordings]
+    server_command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{args.port}',
+                      '--workers', str(args.workers), '--threads', str(args.threads), '--log-level', 'warning', 'app:app']
+
+    stub = subprocess.Popen(stub_command, cwd=SERVER_DIR, stdout=subprocess.DEVNULL)
+    server = None
+    try:
+        wait_until_up(f'{stub_url}/stub/stats', stub)
+        server = subprocess.Popen(server_command, cwd=SERVER_DIR, env=server_env(args, stub_url))
+        wait_until_up(f'{server_url}/', server)
+
+        status = load_test.main(['--url', server_url, '--db', args.db] + load_test_args)
+
+        with urllib.request.urlopen(f'{stub_url}/stub/stats') as response:
+            upstream_calls = json.load(response)
+        print('Upstream (stub) requests:')
+        for route, count in upstream_calls.items():
+            print(f'  {route}: {count}')
+    finally:
+        if server is not None:
+            stop(server)
+        stop(stub)
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()
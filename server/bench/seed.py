@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import argparse
+
+# never point a benchmark at the real database by accident, it only runs against BENCH_DB_URI
+# (a file by default, the server under test has to open the same database, see bench/run_load.py)
+BENCH_DB_FILE = os.path.join(tempfile.gettempdir(), 'silverwolf-bench.db')
+os.environ['SUPABASE_DB_URI'] = os.getenv('BENCH_DB_URI', f'sqlite:///{BENCH_DB_FILE}')
+os.environ['CACHE_TYPE'] = 'SimpleCache'
+os.environ['ASSETS_REFRESH_SECONDS'] = '0'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import insert
+from app import app
+from models import db, Valorant_Player, MMR_History
+from bench.fixtures import TIERS, bench_player, bench_match_id, stable_seed, fake_account_payload, fake_match_info
+import ingest
+
+'''
+Fill the benchmark database with synthetic players and matches at production-like scale, for bench/load_test.py
+- Drops and recreates every table first, so a run with the same arguments always ends with the same data
+- Players are bench0#BNCH, bench1#BNCH, ... with the puuids bench/stub_henrik.py gives them, refreshed just now (no refresh jobs)
+- Every match has 10 of them and goes through ingest.persist_match (players, kills, player_stats), each player gets an mmr history row
+- The defaults make 10k players and 1M kills: python -m bench.seed --players 10000 --matches 5000 --kills 200
+Run from server/, BENCH_DB_URI=postgresql://... to seed a local postgres instead of the sqlite file
+'''
+
+# the same accounts the stub answers with, as val.get_player_stats would have stored them
+
+def seed_players(count: int):
+    now = int(time.time())
+    rows = []
+    for index in range(count):
+        player = bench_player(index)
+        account = fake_account_payload(player['puuid'], player['name'], player['tag'], player['region'], stable_seed(player['puuid']))['data']
+        rows.append({column: account[column] for column in ingest.PLAYER_COLUMNS})
+        rows[-1].update(region=account['region'].upper(), last_refreshed_at=now)
+        if len(rows) == 5000:
+            db.session.execute(insert(Valorant_Player), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(Valorant_Player), rows)
+    db.session.commit()
+
+def mmr_history_rows(match_info: dict, rng: random.Random):
+    rows = []
+    for player in match_info['match_players']:
+        rank = rng.randrange(len(TIERS))
+        rows.append({'match_id': match_info['match_id'], 'puuid': player['puuid'], 'mmr_change': rng.randint(-25, 25), 'refunded_rr': 0,
+                     'was_derank_protected': 0, 'map': match_info['map'], 'account_rank': TIERS[rank], 'account_rr': rng.randint(0, 99),
+                     'account_rank_img': f'https://media.valorant-api.com/competitivetiers/5/{rank + 3}/largeicon.png', 'date': match_info['game_start']})
+    return rows
+
+def seed_matches(count: int, players: int, kills: int, batch_size: int, rng: random.Random):
+    pool = [bench_player(index) for index in range(players)]
+    # one match every 10 minutes, ending now
+    first_start = int(time.time()) - count * 600
+
+    start = time.perf_counter()
+    history = []
+    for index in range(count):
+        participants = rng.sample(pool, min(10, len(pool)))
+        match_info = fake_match_info(bench_match_id(index), kills=kills, seed=rng.getrandbits(32),
+                                     puuids=[player['puuid'] for player in participants], game_start=first_start + index * 600)
+        for player_info, player in zip(match_info['match_players'], participants):
+            player_info['name'], player_info['tag'] = player['name'], player['tag']
+
+        ingest.persist_match(match_info)
+        history += mmr_history_rows(match_info, rng)
+
+        if (index + 1) % batch_size == 0 or index + 1 == count:
+            db.session.execute(insert(MMR_History), history)
+            db.session.commit()
+            history = []
+            elapsed = time.perf_counter() - start
+            print(f'\r{index + 1}/{count} matches, {(index + 1) / elapsed:.0f} matches/s', end='', flush=True)
+    print()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=10000)
+    parser.add_argument('--matches', type=int, default=5000)
+    parser.add_argument('--kills', type=int, default=200, help='kills per match')
+    parser.add_argument('--batch', type=int, default=100, help='matches per commit')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        print(f'Seeding {db.engine.url.render_as_string()}: {args.players} players, {args.matches} matches, {args.matches * args.kills} kills')
+        db.drop_all()
+        db.create_all()
+
+        start = time.perf_counter()
+        seed_players(args.players)
+        seed_matches(args.matches, args.players, args.kills, args.batch, rng)
+        print(f'Done in {time.perf_counter() - start:.1f}s')
+
+if __name__ == '__main__':
+    main()
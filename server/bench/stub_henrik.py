@@ -0,0 +1,223 @@
+import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import aiohttp
+from aiohttp import web
+
+from bench.fixtures import (BENCH_NAMESPACE, BENCH_TAG, bench_player, stable_seed, fake_account_payload, fake_mmr_history_payload, fake_stored_mmr_history_payload,
+                            fake_match_payload, fake_assets_payloads)
+
+'''
+Local stand-in for the henrikdev API and valorant-api.com, so load tests never touch (or get rate limited by) the real ones
+- Serves account, mmr history, stored mmr history and v4 match payloads, plus the asset lists assets.py downloads
+- Recorded payloads win: --recordings DIR serves DIR/<request path>.json when it exists (e.g. DIR/valorant/v4/match/na/<id>.json),
+  with --record-from https://api.henrikdev.xyz misses are fetched there (VAL_API_KEY) and saved, so a run can be replayed offline
+- Everything else is synthetic and deterministic: the same path always gets the same payload, the seeded players (bench/seed.py)
+  resolve to the same name/tag/puuid the database has, names starting with "missing" are 404s
+- A match from a player's (stored) mmr history has that player in it, so what the server stores from the stub shows up in their
+  match history and stats. The stub remembers which history handed out a match id, ask for the history first (like the server does)
+- --latency/--jitter delay every answer, --error-rate answers that share of requests with a 429 (Retry-After: --retry-after),
+  --rate-limit N per --rate-window seconds enforces a quota and sends the x-ratelimit-* headers the server's token bucket follows
+- GET /stub/stats has the request counts per route and status
+Run from server/: python -m bench.stub_henrik --port 8081 --latency 0.15 --jitter 0.1 --error-rate 0.02
+Point the server at it with HENRIK_API_URL=http://127.0.0.1:8081 VALORANT_API_URL=http://127.0.0.1:8081 (bench/run_load.py does)
+'''
+
+class Stub:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.players = {}
+        for index in range(args.players):
+            player = bench_player(index)
+            self.players[player['puuid']] = player
+        # match id -> puuid of the player whose (stored) mmr history handed it out
+        self.match_owners = {}
+        self.assets = fake_assets_payloads(args.seed)
+        self.counts = collections.Counter()
+        self.window_start = time.monotonic()
+        self.window_used = 0
+        self.session = None
+
+    # Identities: seeded players are looked up, anyone else gets one derived from what was asked for
+
+    def by_puuid(self, puuid: str) -> dict:
+        return self.players.get(puuid) or {'puuid': puuid, 'name': f'stub{stable_seed(puuid) % 1000000}', 'tag': 'STUB', 'region': 'na'}
+
+    def by_name(self, name: str, tag: str) -> dict:
+        if name.startswith('bench') and name[5:].isdigit() and tag == BENCH_TAG and int(name[5:]) < self.args.players:
+            return bench_player(int(name[5:]))
+        return {'puuid': str(uuid.uuid5(BENCH_NAMESPACE, f'account/{name}#{tag}')), 'name': name, 'tag': tag, 'region': 'na'}
+
+    def match_ids(self, puuid: str, count: int):
+        match_ids = [str(uuid.uuid5(BENCH_NAMESPACE, f'history/{puuid}/{index}')) for index in range(count)]
+        self.match_owners.update(dict.fromkeys(match_ids, puuid))
+        return match_ids
+
+    # Quota, a fixed window like henrikdev's
+
+    def rate_headers(self) -> dict:
+        if not self.args.rate_limit:
+            return {}
+        reset = max(self.args.rate_window - (time.monotonic() - self.window_start), 0)
+        return {'x-ratelimit-limit': str(self.args.rate_limit), 'x-ratelimit-remaining': str(max(self.args.rate_limit - self.window_used, 0)),
+                'x-ratelimit-reset': str(int(reset) + 1)}
+
+    def take_token(self) -> bool:
+        if not self.args.rate_limit:
+            return True
+        now = time.monotonic()
+        if now - self.window_start >= self.args.rate_window:
+            self.window_start, self.window_used = now, 0
+        if self.window_used >= self.args.rate_limit:
+            return False
+        self.window_used += 1
+        return True
+
+    def too_many_requests(self, retry_after: float) -> web.Response:
+        headers = self.rate_headers()
+        headers['Retry-After'] = str(max(int(retry_after), 1))
+        return web.json_response({'status': 429, 'errors': [{'message': 'Rate limit reached', 'code': 0}]}, status=429, headers=headers)
+
+    # Recorded payloads
+
+    def recording_path(self, path: str) -> str:
+        return os.path.join(self.args.recordings, path.strip('/').replace('/', os.sep) + '.json')
+
+    async def recorded(self, request) -> web.Response:
+        path = self.recording_path(request.path)
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                return web.Response(body=file.read(), content_type='application/json')
+        if not self.args.record_from:
+            return None
+
+        headers = {'Accept': 'application/json', 'Authorization': os.getenv('VAL_API_KEY') or ''}
+        async with self.session.get(f'{self.args.record_from.rstrip("/")}{request.path_qs}', headers=headers) as response:
+            body = await response.read()
+            if response.status == 200:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as file:
+                    file.write(body)
+            return web.Response(body=body, status=response.status, content_type='application/json')
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        if request.path.startswith('/stub/'):
+            return await handler(request)
+
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else 'unmatched'
+        if not self.take_token():
+            response = self.too_many_requests(self.args.rate_window - (time.monotonic() - self.window_start))
+        elif self.args.error_rate and self.rng.random() < self.args.error_rate:
+            response = self.too_many_requests(self.args.retry_after)
+        else:
+            await asyncio.sleep(self.args.latency + self.rng.random() * self.args.jitter)
+            response = (await self.recorded(request) if self.args.recordings else None) or await handler(request)
+            response.headers.update(self.rate_headers())
+
+        self.counts[f'{route} {response.status}'] += 1
+        return response
+
+    # henrikdev
+
+    async def account_by_name(self, request):
+        name, tag = request.match_info['name'], request.match_info['tag']
+        if name.startswith('missing'):
+            return web.json_response({'status': 404, 'errors': [{'message': 'Not found', 'code': 22}]}, status=404)
+        player = self.by_name(name, tag)
+        return web.json_response(fake_account_payload(player['puuid'], player['name'], player['tag'], player['region'], stable_seed(player['puuid'])))
+
+    async def account_by_puuid(self, request):
+        player = self.by_puuid(request.match_info['puuid'])
+        return web.json_response(fake_account_payload(player['puuid'], player['name'], player['tag'], player['region'], stable_seed(player['puuid'])))
+
+    async def mmr_history_by_name(self, request):
+        player = self.by_name(request.match_info['name'], request.match_info['tag'])
+        return web.json_response(fake_mmr_history_payload(player['puuid'], player['name'], player['tag'], self.match_ids(player['puuid'], 20),
+                                                          stable_seed(player['puuid'])))
+
+    async def mmr_history_by_puuid(self, request):
+        player = self.by_puuid(request.match_info['puuid'])
+        return web.json_response(fake_mmr_history_payload(player['puuid'], player['name'], player['tag'], self.match_ids(player['puuid'], 20),
+                                                          stable_seed(player['puuid'])))
+
+    async def stored_mmr_history(self, request):
+        puuid = request.match_info['puuid']
+        return web.json_response(fake_stored_mmr_history_payload(self.match_ids(puuid, self.args.stored_matches), stable_seed(puuid)))
+
+    async def match(self, request):
+        match_id, region = request.match_info['match_id'], request.match_info['region']
+        owner = self.match_owners.get(match_id)
+        known_players = [self.by_puuid(owner)] if owner else []
+        return web.json_response(fake_match_payload(match_id, kills=self.args.kills, seed=stable_seed(match_id), region=region,
+                                                    known_players=known_players))
+
+    # valorant-api.com
+
+    async def asset_list(self, request):
+        return web.json_response(self.assets[request.match_info['kind']])
+
+    async def stats(self, request):
+        return web.json_response(dict(sorted(self.counts.items())))
+
+    async def on_startup(self, app):
+        if self.args.record_from:
+            self.session = aiohttp.ClientSession()
+
+    async def on_cleanup(self, app):
+        if self.session is not None:
+            await self.session.close()
+
+def create_app(args) -> web.Application:
+    stub = Stub(args)
+    app = web.Application(middlewares=[stub.middleware])
+    app.add_routes([
+        web.get('/valorant/v2/account/{name}/{tag}', stub.account_by_name),
+        web.get('/valorant/v2/by-puuid/account/{puuid}', stub.account_by_puuid),
+        web.get('/valorant/v2/mmr-history/{region}/{platform}/{name}/{tag}', stub.mmr_history_by_name),
+        web.get('/valorant/v2/by-puuid/mmr-history/{region}/{platform}/{puuid}', stub.mmr_history_by_puuid),
+        web.get('/valorant/v2/by-puuid/stored-mmr-history/{region}/{platform}/{puuid}', stub.stored_mmr_history),
+        web.get('/valorant/v4/match/{region}/{match_id}', stub.match),
+        web.get('/v1/{kind:competitivetiers|playertitles|playercards}', stub.asset_list),
+        web.get('/stub/stats', stub.stats)
+    ])
+    app.on_startup.append(stub.on_startup)
+    app.on_cleanup.append(stub.on_cleanup)
+    return app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.15, help='seconds added to every answer')
+    parser.add_argument('--jitter', type=float, default=0.1, help='up to this many more seconds, uniformly random')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of requests answered with a 429')
+    parser.add_argument('--retry-after', type=float, default=1, help='Retry-After seconds on injected 429s')
+    parser.add_argument('--rate-limit', type=int, default=0, help='requests per --rate-window before 429s, 0 for no quota')
+    parser.add_argument('--rate-window', type=float, default=60)
+    parser.add_argument('--players', type=int, default=10000, help='seeded players (bench/seed.py --players) to resolve by name/puuid')
+    parser.add_argument('--kills', type=int, default=200, help='kills per synthetic match')
+    parser.add_argument('--stored-matches', type=int, default=50, help='matches per synthetic stored mmr history')
+    parser.add_argument('--recordings', help='directory of recorded payloads, served before synthetic ones')
+    parser.add_argument('--record-from', help='fetch recording misses from this API and save them to --recordings')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.record_from and not args.recordings:
+        parser.error('--record-from needs --recordings')
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    web.run_app(create_app(args), host=args.host, port=args.port, print=lambda message: print(message, flush=True))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import uuid
+import hashlib
+import functools
+from urllib.parse import urlencode
+
+from flask import request, current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import cache
+from models import db
+import etags
+import encoding
+import projection
+
+from typing import Callable, Iterable, List, Optional
+
+'''
+Tag based invalidation on top of the shared Flask-Caching backend (Redis or the filesystem, see app.py)
+- Every cached view names the tags its response depends on (player/<puuid>, player-name/<name>#<tag>, match/<match_id>, map/<map>)
+- Each tag has a version stored in the cache itself and the versions are part of the view's cache key
+- Invalidating a tag gives it a new version, so every worker stops finding the old entries at once (they just expire)
+- Writers don't invalidate directly, they mark tags on the db session and they're invalidated once the commit went through
+- Keys include the normalized query string and response format, and what gets cached is the finished response with its ETag (see etags.py)
+'''
+
+def player_tags(puuid: Optional[str] = None, name: Optional[str] = None, tag: Optional[str] = None) -> List[str]:
+    tags = []
+    if puuid is not None:
+        tags.append(f'player/{puuid}')
+    if name is not None and tag is not None:
+        tags.append(f'player-name/{name}#{tag}'.lower())
+    return tags
+
+def match_tags(match_id: str) -> List[str]:
+    return [f'match/{match_id}']
+
+def map_tags(map: str) -> List[str]:
+    return [f'map/{map}']
+
+def _version_keys(tags: Iterable[str]) -> List[str]:
+    return [f'tag-version/{tag}' for tag in tags]
+
+def invalidate(*tags: str):
+    if tags:
+        cache.set_many({key: uuid.uuid4().hex for key in _version_keys(tags)}, timeout=0)
+
+# Invalidate these tags after the current transaction commits (dropped if it rolls back)
+
+def invalidate_after_commit(*tags: str, session: Optional[Session] = None):
+    if session is None:
+        session = db.session()
+    session.info.setdefault('cache_tags', set()).update(tags)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_tags(session):
+    tags = session.info.pop('cache_tags', None)
+    if tags:
+        try:
+            invalidate(*tags)
+        except Exception:
+            # a stale entry for a few minutes beats failing a write that already committed
+            current_app.logger.exception(f'Could not invalidate cache tags {sorted(tags)}')
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_rolled_back_tags(session):
+    session.info.pop('cache_tags', None)
+
+# Query args in a canonical form, only folding together what the views answer the same way:
+# comma list args (projection.LIST_ARGS) are sets and blank ones are missing, everything else is kept as sent
+# (names are case sensitive, blank is not missing, the first of repeated values wins), just in a stable order
+
+def normalized_query_string() -> str:
+    args = []
+    for key in request.args:
+        values = request.args.getlist(key)
+        if key in projection.LIST_ARGS:
+            parts = sorted({part.strip() for value in values for part in value.split(',') if part.strip()})
+            if parts:
+                args.append((key, ','.join(parts)))
+        else:
+            args.extend((key, value) for value in values)
+    # stable, so repeated values keep their order
+    return urlencode(sorted(args, key=lambda arg: arg[0]))
+
+# cache.cached for a view whose entries are dropped when any of its tags are invalidated
+# `tags` gets the view args and returns the tags of the response
+
+def cached_view(tags: Callable[..., List[str]], timeout: int = 300, **cached_kwargs):
+    def make_cache_key(*args, **view_args) -> str:
+        view_tags = tags(**view_args)
+        versions = cache.get_many(*_version_keys(view_tags)) if view_tags else []
+
+        key = request.path + '?' + normalized_query_string() + '#' + encoding.response_format()
+        key += '|' + ','.join(str(version or 0) for version in versions)
+        return 'view/' + hashlib.sha256(key.encode()).hexdigest()
+
+    def decorator(f):
+        @functools.wraps(f)
+        def view_response(*args, **kwargs):
+            return etags.tagged(encoding.render(current_app.ensure_sync(f)(*args, **kwargs)))
+
+        return cache.cached(timeout=timeout, make_cache_key=make_cache_key, **cached_kwargs)(view_response)
+    return decorator
@@ -0,0 +1,48 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+'''
+JSON encoding/decoding for upstream payloads (upstream.py) and our responses (Flask's app.json)
+- orjson when it's installed, several times faster both ways on match payloads, otherwise the stdlib json module
+- Responses keep the shape Flask's default provider gives them (sorted keys, indented in debug), non-ASCII is sent as UTF-8 instead of escaped
+'''
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class JSONProvider(DefaultJSONProvider):
+    def _orjson_options(self, **kwargs) -> int:
+        options = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            options |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._orjson_options(**kwargs)).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+
+        # straight to bytes, skipping the str round trip of the default provider
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._orjson_options(indent=indent)) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,121 @@
+import gzip
+
+from flask import request, make_response, Response
+
+import etags
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+'''
+Smaller match payloads on the wire
+- Responses over COMPRESS_MIN_SIZE are compressed with zstd or gzip, whichever the client prefers (zstd needs the zstandard package)
+- Accept: application/msgpack gets the same document as msgpack instead of JSON (needs the msgpack package)
+- ?kills=columnar sends match_kills as columns, with puuids and weapon ids dictionary encoded (a list of each once, kills index into it)
+'''
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_MIMETYPES = {'application/json', etags.MSGPACK_MIMETYPE}
+
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+def response_format() -> str:
+    if msgpack is not None and request.accept_mimetypes.best_match(['application/json', etags.MSGPACK_MIMETYPE, 'application/x-msgpack']) in (etags.MSGPACK_MIMETYPE, 'application/x-msgpack'):
+        return 'msgpack'
+    return 'json'
+
+def _dictionary_index(dictionary, indexes, value):
+    if value not in indexes:
+        indexes[value] = len(dictionary)
+        dictionary.append(value)
+    return indexes[value]
+
+# [{'killer_puuid': ..., 'weapon_id': ..., ...}, ...] -> {'puuids': [...], 'weapons': [...], 'columns': {'killer_puuid': [0, 3, ...], ...}}
+
+def columnar_kills(kills):
+    puuids, puuid_indexes = [], {}
+    weapons, weapon_indexes = [], {}
+    columns = {}
+
+    for kill in kills:
+        for key, value in kill.items():
+            if key in ('killer_puuid', 'victim_puuid'):
+                value = _dictionary_index(puuids, puuid_indexes, value)
+            elif key == 'assistants':
+                value = [_dictionary_index(puuids, puuid_indexes, assistant) for assistant in value]
+            elif key == 'weapon_id':
+                value = _dictionary_index(weapons, weapon_indexes, value)
+            columns.setdefault(key, []).append(value)
+
+    return {'count': len(kills), 'puuids': puuids, 'weapons': weapons, 'columns': columns}
+
+def _apply_kill_layout(data):
+    if isinstance(data.get('match_kills'), list):
+        data = dict(data, match_kills=columnar_kills(data['match_kills']))
+    if isinstance(data.get('matches'), list):
+        data = dict(data, matches=[_apply_kill_layout(match) for match in data['matches']])
+    return data
+
+# Turn a view's return value into a response in the format the client asked for
+
+def render(rv) -> Response:
+    body, rest = (rv[0], rv[1:]) if isinstance(rv, tuple) else (rv, ())
+    if not isinstance(body, dict):
+        return make_response(rv)
+
+    if str(request.args.get('kills')).lower() == 'columnar':
+        body = _apply_kill_layout(body)
+
+    if response_format() == 'msgpack':
+        body = Response(msgpack.packb(body), mimetype=etags.MSGPACK_MIMETYPE)
+
+    response = make_response(body, *rest)
+    response.vary.add('Accept')
+    return response
+
+def _choose_encoding():
+    encodings = ['zstd', 'gzip'] if zstandard is not None else ['gzip']
+    return request.accept_encodings.best_match(encodings)
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+def init_app(app):
+    # registered after etags.init_app, so this runs first and the conditional check sees the encoded ETag
+    @app.after_request
+    def compress_response(response: Response) -> Response:
+        if response.is_streamed or response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return response
+        if response.status_code != 200 or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if response.content_length is not None and response.content_length < COMPRESS_MIN_SIZE:
+            return response
+
+        encoding = _choose_encoding()
+        if encoding is None:
+            return response
+
+        etag, weak = etags.tagged(response).get_etag()
+        if etag is not None:
+            # same content, different bytes, so the strong ETag has to differ per encoding
+            etag = f'{etag}-{encoding}'
+            response.set_etag(etag, weak)
+            if request.if_none_match.contains(etag):
+                # it'll be a 304, skip compressing a body we won't send
+                return response
+
+        response.set_data(_compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,24 @@
+from flask import request, Response
+
+'''
+Strong ETags on JSON responses, with 304s for matching If-None-Match requests
+- The ETag is a hash of the serialized body, so it changes exactly when the content does
+- Cached views (cache_tags.cached_view) store the finished response with its ETag, a conditional hit never re-serializes anything
+'''
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+def is_taggable(response: Response) -> bool:
+    return response.status_code == 200 and not response.is_streamed and response.mimetype in ('application/json', MSGPACK_MIMETYPE)
+
+def tagged(response: Response) -> Response:
+    if is_taggable(response) and 'ETag' not in response.headers:
+        response.add_etag()
+    return response
+
+def init_app(app):
+    @app.after_request
+    def conditional_response(response: Response) -> Response:
+        if not is_taggable(response):
+            return response
+        return tagged(response).make_conditional(request)
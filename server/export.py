@@ -0,0 +1,178 @@
+import os
+import io
+import json
+import argparse
+import tempfile
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select, func, ARRAY, JSON
+
+from models import db, Competitive_Match, Competitive_Match_Player, Competitive_Match_Kill
+
+from typing import Dict, Iterator, Optional, Tuple
+
+'''
+Parquet export of stored matches (competitive_match, competitive_match_player, competitive_match_kills) for offline analytics,
+so datasets don't have to be scraped off the JSON routes
+- Written as <out>/<table>/region=<region>/month=<YYYY-MM>/part-<after>-<until>.parquet (hive partitioning, so pyarrow.dataset,
+  duckdb, spark etc. read a whole table folder and prune by region/month), month is the match's game_start in UTC
+- Rows come off server-side cursors EXPORT_BATCH_SIZE at a time and go straight to the files, memory stays flat however much is exported
+- Incremental: an export covers the matches with after < competitive_match.id <= until (the highest id when it started) and leaves
+  until in <out>/_watermark.json, the next export starts there. A match that commits with a lower id after an export ran is only
+  picked up by a --full export
+Run from server/: python export.py <out dir> [--after <match id>] [--full], or GET /export/<table>.parquet?after=<match id> for one file
+'''
+
+EXPORT_BATCH_SIZE = 5000
+
+EXPORT_TABLES = {
+    'competitive_match': Competitive_Match,
+    'competitive_match_player': Competitive_Match_Player,
+    'competitive_match_kills': Competitive_Match_Kill
+}
+
+WATERMARK_FILE = '_watermark.json'
+
+PARQUET_MIMETYPE = 'application/vnd.apache.parquet'
+
+def _arrow_type(column) -> pa.DataType:
+    if isinstance(column.type, (ARRAY, JSON)):
+        return pa.list_(pa.string())
+    return {int: pa.int64(), float: pa.float64(), str: pa.string()}[column.type.python_type]
+
+# The table's columns, plus region/month when they aren't in the file path
+
+def export_schema(model, with_partition_columns: bool = False) -> pa.Schema:
+    fields = [pa.field(column.name, _arrow_type(column), nullable=column.nullable) for column in model.__table__.columns]
+    if with_partition_columns:
+        fields += [pa.field('partition_region', pa.string()), pa.field('partition_month', pa.string())]
+    return pa.schema(fields)
+
+def _month(game_start: int) -> str:
+    return datetime.fromtimestamp(game_start, timezone.utc).strftime('%Y-%m')
+
+def latest_match_id() -> int:
+    return db.session.execute(select(func.max(Competitive_Match.id))).scalar() or 0
+
+# Rows of `model` for the matches in (after, until], as {(region, month): {column: [values]}} one cursor batch at a time
+
+def iter_batches(model, after: int, until: int) -> Iterator[Dict[Tuple[str, str], Dict[str, list]]]:
+    names = [column.name for column in model.__table__.columns]
+    query = select(*model.__table__.columns, Competitive_Match.region.label('partition_region'), Competitive_Match.game_start.label('partition_game_start'))
+    if model is not Competitive_Match:
+        query = query.join(Competitive_Match, Competitive_Match.id == model.match_id)
+
+    query = query.where(
+        Competitive_Match.id > after,
+        Competitive_Match.id <= until
+    ).order_by(Competitive_Match.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    for rows in db.session.execute(query).partitions():
+        partitions = {}
+        for row in rows:
+            partitions.setdefault((row.partition_region, _month(row.partition_game_start)), []).append(row)
+
+        yield {
+            partition: {name: list(values) for name, values in zip(names, zip(*partition_rows))}
+            for partition, partition_rows in partitions.items()
+        }
+
+def _read_watermark(out_dir: str) -> int:
+    try:
+        with open(os.path.join(out_dir, WATERMARK_FILE)) as file:
+            return json.load(file)['competitive_match_id']
+    except FileNotFoundError:
+        return 0
+
+def _write_watermark(out_dir: str, until: int):
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    with open(path + '.tmp', 'w') as file:
+        json.dump({'competitive_match_id': until, 'exported_at': int(datetime.now(timezone.utc).timestamp())}, file)
+    os.replace(path + '.tmp', path)
+
+# Export every table into `out_dir` for the matches after the watermark (or `after`), returns what was written
+# Files are written under a temporary name and only renamed (and the watermark moved) once every table is done
+
+def export_to_directory(out_dir: str, after: Optional[int] = None) -> Dict:
+    if after is None:
+        after = _read_watermark(out_dir)
+    until = latest_match_id()
+    summary = {'after': after, 'until': until, 'rows': {}, 'files': []}
+    if until <= after:
+        return summary
+
+    written = []
+    try:
+        for table, model in EXPORT_TABLES.items():
+            schema = export_schema(model)
+            writers = {}
+            summary['rows'][table] = 0
+            try:
+                for partitions in iter_batches(model, after, until):
+                    for (region, month), columns in partitions.items():
+                        if (region, month) not in writers:
+                            directory = os.path.join(out_dir, table, f'region={region}', f'month={month}')
+                            os.makedirs(directory, exist_ok=True)
+                            path = os.path.join(directory, f'part-{after}-{until}.parquet')
+                            writers[(region, month)] = pq.ParquetWriter(path + '.tmp', schema, compression='zstd')
+                            written.append(path)
+                        writers[(region, month)].write_batch(pa.record_batch(columns, schema=schema))
+                        summary['rows'][table] += len(columns[schema.names[0]])
+            finally:
+                for writer in writers.values():
+                    writer.close()
+    except BaseException:
+        for path in written:
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+        raise
+
+    for path in written:
+        os.replace(path + '.tmp', path)
+    _write_watermark(out_dir, until)
+
+    summary['files'] = written
+    return summary
+
+# One Parquet file with all partitions of a table (region/month as partition_region/partition_month columns), for the export endpoint
+# Spooled to disk past a few MB, returns the file rewound to the start, the watermark it goes up to and the row count
+
+def export_table_file(table: str, after: int = 0) -> Tuple[io.IOBase, int, int]:
+    model = EXPORT_TABLES[table]
+    schema = export_schema(model, with_partition_columns=True)
+    until = latest_match_id()
+
+    file = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    rows = 0
+    with pq.ParquetWriter(file, schema, compression='zstd') as writer:
+        for partitions in iter_batches(model, after, until):
+            for (region, month), columns in partitions.items():
+                count = len(columns[schema.names[0]])
+                columns = dict(columns, partition_region=[region] * count, partition_month=[month] * count)
+                writer.write_batch(pa.record_batch(columns, schema=schema))
+                rows += count
+
+    file.seek(0)
+    return file, until, rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Export stored matches, players and kills as partitioned Parquet')
+    parser.add_argument('out_dir')
+    parser.add_argument('--after', type=int, default=None, help='export matches with a competitive_match.id above this (default: the watermark in out_dir)')
+    parser.add_argument('--full', action='store_true', help='export everything, ignoring the watermark (into a new out_dir, the old parts would overlap)')
+    args = parser.parse_args()
+
+    summary = export_to_directory(args.out_dir, after=0 if args.full else args.after)
+    if summary['until'] <= summary['after']:
+        print(f'Nothing to export after match id {summary["after"]}')
+    else:
+        print(f'Exported matches {summary["after"]} < id <= {summary["until"]}: '
+              + ', '.join(f'{rows} {table} rows' for table, rows in summary['rows'].items())
+              + f' in {len(summary["files"])} files')
+
+if __name__ == '__main__':
+    from app import app
+    with app.app_context():
+        main()
@@ -0,0 +1,24 @@
+import os
+import shutil
+import tempfile
+
+'''
+Gunicorn settings picked up when gunicorn runs from server/ (gunicorn app:app)
+- Metrics: every worker writes its samples under PROMETHEUS_MULTIPROC_DIR and /metrics sums them (see metrics.py),
+  the directory is emptied when gunicorn starts and a worker's live samples are dropped when it exits
+'''
+
+# set before any worker imports the app, prometheus_client picks its storage when it's first imported
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'silverwolf-metrics'))
+
+def on_starting(server):
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
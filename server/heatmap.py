@@ -0,0 +1,110 @@
+import time
+import hashlib
+import itertools
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select, func
+from sqlalchemy.orm import aliased
+
+from app import cache
+from models import db, Competitive_Match, Competitive_Match_Player, Competitive_Match_Kill
+from val import MISSING_POSITION
+
+from typing import Dict, Optional, Tuple
+
+'''
+Kill/death position heatmaps per map
+- Positions are binned on a fixed HEATMAP_BINS x HEATMAP_BINS grid over [-HEATMAP_EXTENT, HEATMAP_EXTENT] (game coordinates) with np.histogram2d
+- The grids for each (map, filters) live in the shared cache with a watermark (the highest kill id they count),
+  a request only bins the kills stored since then and adds them on, so it stays fast however many kills the map has
+- Kills are committed out of id order now and then (concurrent ingests), one that lands below the watermark is missed until
+  the grids are rebuilt from scratch after HEATMAP_REBUILD_SECONDS
+'''
+
+def _filters_key(map: str, puuid: Optional[str], agent: Optional[str], weapon: Optional[str]) -> str:
+    key = '|'.join(str(value) for value in (map, puuid, agent, weapon, current_app.config['HEATMAP_BINS'], current_app.config['HEATMAP_EXTENT']))
+    return 'heatmap/' + hashlib.sha256(key.encode()).hexdigest()
+
+def _empty_grid() -> np.ndarray:
+    bins = current_app.config['HEATMAP_BINS']
+    return np.zeros((bins, bins), dtype=np.int64)
+
+# Positions (kills: where the killer stood, deaths: where the victim died) with min_id < id <= max_id that match the filters
+
+def _positions_query(side: str, map: str, puuid: Optional[str], agent: Optional[str], weapon: Optional[str], min_id: int, max_id: int):
+    if side == 'kills':
+        x, y, player_puuid = Competitive_Match_Kill.killer_x, Competitive_Match_Kill.killer_y, Competitive_Match_Kill.killer_puuid
+    else:
+        x, y, player_puuid = Competitive_Match_Kill.victim_x, Competitive_Match_Kill.victim_y, Competitive_Match_Kill.victim_puuid
+
+    query = (
+        select(x, y)
+        .join(Competitive_Match, Competitive_Match.id == Competitive_Match_Kill.match_id)
+        .where(
+            Competitive_Match.map == map,
+            Competitive_Match_Kill.id > min_id,
+            Competitive_Match_Kill.id <= max_id
+        )
+    )
+    if puuid is not None:
+        query = query.where(player_puuid == puuid)
+    if weapon is not None:
+        query = query.where(Competitive_Match_Kill.weapon_id == weapon)
+    if agent is not None:
+        player = aliased(Competitive_Match_Player)
+        query = query.join(player, (player.match_id == Competitive_Match_Kill.match_id) & (player.puuid == player_puuid)).where(player.agent == agent)
+    return query
+
+def _histogram(positions: np.ndarray) -> Tuple[np.ndarray, int]:
+    extent = current_app.config['HEATMAP_EXTENT']
+    if len(positions) == 0:
+        return _empty_grid(), 0
+
+    positions = positions[(positions[:, 0] != MISSING_POSITION) & (positions[:, 1] != MISSING_POSITION)]
+    grid, _, _ = np.histogram2d(positions[:, 0], positions[:, 1], bins=current_app.config['HEATMAP_BINS'], range=[[-extent, extent], [-extent, extent]])
+    grid = grid.astype(np.int64)
+    # positions outside the extent aren't binned, so count what is
+    return grid, int(grid.sum())
+
+def _bin(side: str, min_id: int, max_id: int, **filters) -> Tuple[np.ndarray, int]:
+    rows = db.session.execute(_positions_query(side, min_id=min_id, max_id=max_id, **filters)).all()
+    # np.array() on Row objects probes each one for the array protocol, flattening them is an order of magnitude faster
+    positions = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.float64, count=2 * len(rows))
+    return _histogram(positions.reshape(-1, 2))
+
+# {'kills': grid, 'deaths': grid, ...} where grid[i][j] counts positions in x bin i, y bin j
+
+def get_heatmap(map: str, puuid: Optional[str] = None, agent: Optional[str] = None, weapon: Optional[str] = None) -> Dict:
+    filters = {'map': map, 'puuid': puuid, 'agent': agent, 'weapon': weapon}
+    key = _filters_key(**filters)
+
+    state = cache.get(key)
+    if state is None or state['built_at'] < time.time() - current_app.config['HEATMAP_REBUILD_SECONDS']:
+        state = {'watermark': 0, 'built_at': int(time.time()), 'kills': _empty_grid(), 'deaths': _empty_grid(), 'total_kills': 0, 'total_deaths': 0}
+
+    high = db.session.execute(select(func.max(Competitive_Match_Kill.id))).scalar() or 0
+
+    if high > state['watermark']:
+        kills, kill_count = _bin('kills', state['watermark'], high, **filters)
+        deaths, death_count = _bin('deaths', state['watermark'], high, **filters)
+        state = {
+            'watermark': high,
+            'built_at': state['built_at'],
+            'kills': state['kills'] + kills,
+            'deaths': state['deaths'] + deaths,
+            'total_kills': state['total_kills'] + kill_count,
+            'total_deaths': state['total_deaths'] + death_count
+        }
+        cache.set(key, state, timeout=current_app.config['HEATMAP_REBUILD_SECONDS'])
+
+    extent = current_app.config['HEATMAP_EXTENT']
+    return {
+        'map': map,
+        'bins': current_app.config['HEATMAP_BINS'],
+        'extent': [-extent, extent],
+        'total_kills': state['total_kills'],
+        'total_deaths': state['total_deaths'],
+        'kills': state['kills'].tolist(),
+        'deaths': state['deaths'].tolist()
+    }
@@ -0,0 +1,229 @@
+import io
+import csv
+import time
+
+from sqlalchemy import select, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models import db, Valorant_Player, MMR_History, Competitive_Match, Competitive_Match_Player, Competitive_Match_Kill, Player_Stats
+
+from typing import List, Dict, Optional
+
+import cache_tags
+
+'''
+Batched write paths for data we pull from the Valorant API
+- Each ingest costs a constant number of round trips no matter how many rows come back
+- Nothing here commits, callers decide when the transaction ends
+- Everything goes through db.session unless a session is passed in (asyncdb.run_sync passes one from the async engine)
+- Cached responses that depend on what we wrote are invalidated once the caller commits (see cache_tags.py)
+'''
+
+# Past this many rows we COPY into postgres instead of a multi-row insert
+
+COPY_THRESHOLD = 500
+
+PLAYER_COLUMNS = ['puuid', 'name', 'tag', 'region', 'account_level', 'title', 'card']
+
+MATCH_COLUMNS = ['match_id', 'map', 'game_length', 'game_start', 'region', 'server', 'blue_score', 'red_score', 'who_won']
+
+MATCH_PLAYER_COLUMNS = ['puuid', 'name', 'tag', 'agent', 'party_id', 'team', 'score', 'kills', 'deaths', 'assists',
+                        'headshots', 'bodyshots', 'legshots', 'damage_dealt', 'damage_received',
+                        'c_ability', 'e_ability', 'q_ability', 'x_ability']
+
+MATCH_KILL_COLUMNS = ['time_in_round', 'round', 'killer_puuid', 'victim_puuid', 'killer_x', 'killer_y',
+                      'victim_x', 'victim_y', 'killer_view', 'weapon_id', 'assistants']
+
+# competitive_match_player columns summed into player_stats as is
+
+PLAYER_STATS_SUM_COLUMNS = ['score', 'kills', 'deaths', 'assists', 'headshots', 'bodyshots', 'legshots', 'damage_dealt', 'damage_received']
+
+PLAYER_STATS_COUNTERS = ['matches', 'wins', 'ties', 'rounds'] + PLAYER_STATS_SUM_COLUMNS
+
+# INSERT for the current bind's dialect, so postgres (and sqlite for local runs) get ON CONFLICT support
+
+def dialect_insert(model, session: Optional[Session] = None):
+    dialect = (session or db.session).get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model)
+    elif dialect == 'sqlite':
+        return sqlite.insert(model)
+    return insert(model)
+
+# Insert a player from val.get_player_stats/get_verbose_player_stats, or update the row we already have for them
+
+def store_player(player_info: Dict, existing_player: Optional[Valorant_Player] = None, session: Optional[Session] = None) -> Valorant_Player:
+    if session is None:
+        session = db.session()
+
+    player = existing_player if existing_player is not None else Valorant_Player()
+    if existing_player is not None:
+        # responses cached under the old name#tag are out of date too
+        cache_tags.invalidate_after_commit(*cache_tags.player_tags(name=existing_player.name, tag=existing_player.tag), session=session)
+    cache_tags.invalidate_after_commit(*cache_tags.player_tags(player_info['puuid'], player_info['name'], player_info['tag']), session=session)
+
+    for column in PLAYER_COLUMNS:
+        setattr(player, column, player_info[column])
+    player.last_refreshed_at = int(time.time())
+
+    if existing_player is None:
+        session.add(player)
+    return player
+
+# Store the matches from an mmr history fetch that we don't have yet, returns how many rows were inserted
+# One set-based lookup for the match ids we already have, then one multi-row insert for the rest
+
+def ingest_mmr_history(puuid: str, mmr_history: List[Dict], session: Optional[Session] = None) -> int:
+    if session is None:
+        session = db.session()
+
+    rows = {}
+    for match in mmr_history:
+        rows.setdefault(match['match_id'], {
+            'match_id': match['match_id'],
+            'puuid': puuid,
+            'mmr_change': match['mmr_change'],
+            'refunded_rr': match['refunded_rr'],
+            'was_derank_protected': match['was_derank_protected'],
+            'map': match['map'],
+            'account_rank': match['account_rank'],
+            'account_rr': match['account_rr'],
+            'account_rank_img': match['account_rank_img'],
+            'date': match['date']
+        })
+
+    if not rows:
+        return 0
+
+    existing_match_ids = set(session.execute(
+        select(MMR_History.match_id).where(
+            MMR_History.puuid == puuid,
+            MMR_History.match_id.in_(list(rows))
+        )
+    ).scalars())
+
+    new_rows = [row for match_id, row in rows.items() if match_id not in existing_match_ids]
+    if not new_rows:
+        return 0
+
+    # another worker can insert the same match between our lookup and insert, the (puuid, match_id) constraint skips those
+    statement = dialect_insert(MMR_History, session)
+    if hasattr(statement, 'on_conflict_do_nothing'):
+        statement = statement.on_conflict_do_nothing()
+
+    inserted = session.execute(statement.returning(MMR_History.id), new_rows).all()
+    if inserted:
+        player = session.execute(
+            select(Valorant_Player.name, Valorant_Player.tag).where(Valorant_Player.puuid == puuid)
+        ).first()
+        cache_tags.invalidate_after_commit(*cache_tags.player_tags(puuid, *(player or (None, None))), session=session)
+    return len(inserted)
+
+# Postgres array literal for COPY (csv), every element quoted so commas/braces in values can't break it
+
+def _copy_value(value):
+    if isinstance(value, list):
+        return '{' + ','.join('"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value) + '}'
+    return value
+
+# COPY rows into a table on the session's connection, so it is part of the same transaction
+
+def _copy_rows(session, table, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_copy_value(row[column]) for column in columns])
+    buffer.seek(0)
+
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+def _bulk_insert(session, model, columns, rows):
+    if not rows:
+        return
+
+    bind = session.get_bind()
+    if len(rows) >= COPY_THRESHOLD and bind.dialect.name == 'postgresql' and bind.dialect.driver == 'psycopg2':
+        _copy_rows(session, model.__table__, columns, rows)
+    else:
+        session.execute(insert(model), rows)
+
+# Store a match from val.get_match_info with its players and kills, returns the new competitive_match id
+# The match row, players and kills are each a single statement (or COPY for big kill lists) in the caller's transaction
+# Routes, the worker and backfills store matches concurrently: a match_id that's already stored (or being stored by a transaction
+# that commits first) writes nothing and returns None. Dialects without ON CONFLICT raise IntegrityError, hold a savepoint for those
+
+def persist_match(full_match_info: Dict, session: Optional[Session] = None) -> Optional[int]:
+    if session is None:
+        session = db.session()
+
+    match_row = {column: full_match_info.get(column) for column in MATCH_COLUMNS}
+    match_row['blue_score'] = full_match_info.get('blue_score', 0)
+    match_row['red_score'] = full_match_info.get('red_score', 0)
+
+    statement = dialect_insert(Competitive_Match, session)
+    if hasattr(statement, 'on_conflict_do_nothing'):
+        statement = statement.on_conflict_do_nothing(index_elements=['match_id'])
+    new_match_id = session.execute(statement.returning(Competitive_Match.id), match_row).scalar_one_or_none()
+    if new_match_id is None:
+        return None
+
+    players = []
+    for player_info in full_match_info['match_players']:
+        player = {column: player_info[column] for column in MATCH_PLAYER_COLUMNS}
+        player['match_id'] = new_match_id
+        players.append(player)
+
+    kills = []
+    for kill_info in full_match_info['match_kills']:
+        kill = {column: kill_info.get(column) for column in MATCH_KILL_COLUMNS}
+        kill['assistants'] = kill_info.get('assistants', [])
+        kill['match_id'] = new_match_id
+        kills.append(kill)
+
+    _bulk_insert(session, Competitive_Match_Player, MATCH_PLAYER_COLUMNS + ['match_id'], players)
+    _bulk_insert(session, Competitive_Match_Kill, MATCH_KILL_COLUMNS + ['match_id'], kills)
+    add_to_player_stats(match_row, players, session)
+
+    tags = cache_tags.match_tags(full_match_info['match_id']) + cache_tags.map_tags(full_match_info['map'])
+    for player in full_match_info['match_players']:
+        tags += cache_tags.player_tags(player['puuid'], player['name'], player['tag'])
+    cache_tags.invalidate_after_commit(*tags, session=session)
+
+    return new_match_id
+
+# Add one match to the player_stats totals of everyone in it, a single upsert that increments the existing rows
+# Only call this for a match that was just inserted, the totals can't tell a match apart from one they already counted
+
+def add_to_player_stats(match_row: Dict, players: List[Dict], session: Optional[Session] = None):
+    if session is None:
+        session = db.session()
+
+    rows = []
+    for player in players:
+        totals = {
+            'matches': 1,
+            'wins': int(player['team'] == match_row['who_won']),
+            'ties': int(match_row['who_won'] == 'tie'),
+            'rounds': (match_row['blue_score'] or 0) + (match_row['red_score'] or 0)
+        }
+        totals.update({column: player[column] or 0 for column in PLAYER_STATS_SUM_COLUMNS})
+
+        for scope, scope_value in (('overall', ''), ('agent', player['agent']), ('map', match_row['map'])):
+            rows.append(dict(totals, puuid=player['puuid'], scope=scope, scope_value=scope_value))
+
+    if not rows:
+        return
+
+    # same row order in every transaction, so two matches with the same players can't deadlock on the row locks
+    rows.sort(key=lambda row: (row['puuid'], row['scope'], row['scope_value']))
+
+    statement = dialect_insert(Player_Stats, session)
+    statement = statement.on_conflict_do_update(
+        index_elements=['puuid', 'scope', 'scope_value'],
+        set_={column: getattr(Player_Stats, column) + getattr(statement.excluded, column) for column in PLAYER_STATS_COUNTERS}
+    )
+    session.execute(statement, rows)
@@ -0,0 +1,99 @@
+import time
+
+from sqlalchemy import select, update, delete, or_, and_
+from sqlalchemy.orm import Session
+from models import db, Refresh_Job
+from ingest import dialect_insert
+
+from typing import List, Dict, Optional
+
+'''
+Durable queue of refresh jobs (player profile, mmr history, match) in the refresh_job table
+- Routes enqueue, worker.py claims with SELECT ... FOR UPDATE SKIP LOCKED so any number of workers can share the table
+- A job that stays 'running' past its lease (its worker died) can be claimed again
+- Failed jobs are retried with a growing delay until JOB_MAX_ATTEMPTS, then kept as 'failed' for inspection
+'''
+
+KIND_PLAYER = 'player'
+KIND_MMR_HISTORY = 'mmr_history'
+KIND_MATCH = 'match'
+
+PRIORITY_LOW = 0
+PRIORITY_HIGH = 10
+
+# Queue a job unless the same (kind, key) is already queued/running, doesn't commit
+
+def enqueue(kind: str, key: str, payload: Dict, priority: int = PRIORITY_LOW, delay: int = 0):
+    now = int(time.time())
+    statement = dialect_insert(Refresh_Job).values(
+        kind=kind,
+        key=key,
+        payload=payload,
+        priority=priority,
+        status='queued',
+        attempts=0,
+        run_after=now + delay,
+        created_at=now
+    )
+    if hasattr(statement, 'on_conflict_do_nothing'):
+        statement = statement.on_conflict_do_nothing()
+    db.session.execute(statement)
+
+def enqueue_player_refresh(puuid: Optional[str] = None, name: Optional[str] = None, tag: Optional[str] = None, priority: int = PRIORITY_LOW):
+    if puuid is not None:
+        enqueue(KIND_PLAYER, puuid, {'puuid': puuid}, priority)
+    else:
+        enqueue(KIND_PLAYER, f'{name}#{tag}'.lower(), {'name': name, 'tag': tag}, priority)
+
+def enqueue_mmr_history_refresh(region: str, puuid: str, priority: int = PRIORITY_LOW):
+    enqueue(KIND_MMR_HISTORY, puuid, {'region': region, 'puuid': puuid}, priority)
+
+def enqueue_match_fetch(region: str, match_id: str, priority: int = PRIORITY_LOW):
+    enqueue(KIND_MATCH, match_id, {'region': region, 'match_id': match_id}, priority)
+
+# Claim up to `limit` runnable jobs and mark them running, commits so the row locks are only held for the claim
+
+def claim(limit: int, lease_seconds: int, session: Optional[Session] = None) -> List[Dict]:
+    if session is None:
+        session = db.session()
+
+    now = int(time.time())
+    query = select(Refresh_Job).where(
+        or_(
+            and_(Refresh_Job.status == 'queued', Refresh_Job.run_after <= now),
+            and_(Refresh_Job.status == 'running', Refresh_Job.locked_at < now - lease_seconds)
+        )
+    ).order_by(Refresh_Job.priority.desc(), Refresh_Job.run_after).limit(limit).with_for_update(skip_locked=True)
+
+    claimed = []
+    for job in session.scalars(query).all():
+        job.status = 'running'
+        job.locked_at = now
+        job.attempts += 1
+        claimed.append({'id': job.id, 'kind': job.kind, 'key': job.key, 'payload': dict(job.payload), 'attempts': job.attempts})
+
+    session.commit()
+    return claimed
+
+# Finished jobs are deleted, the data they refreshed is what we keep
+
+def complete(job_id: int, session: Optional[Session] = None):
+    if session is None:
+        session = db.session()
+
+    session.execute(delete(Refresh_Job).where(Refresh_Job.id == job_id))
+    session.commit()
+
+def fail(job: Dict, error: str, max_attempts: int, retry_delay: int, session: Optional[Session] = None):
+    if session is None:
+        session = db.session()
+
+    values = {'last_error': error[:1000], 'locked_at': None}
+    if job['attempts'] >= max_attempts:
+        values['status'] = 'failed'
+    else:
+        values['status'] = 'queued'
+        values['run_after'] = int(time.time()) + retry_delay * 2 ** (job['attempts'] - 1)
+
+    session.execute(update(Refresh_Job).where(Refresh_Job.id == job['id']).values(**values))
+    session.commit()
@@ -0,0 +1,158 @@
+import os
+import time
+import functools
+
+from flask import request, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Histogram
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+from typing import Optional, Tuple
+
+'''
+Prometheus metrics, served as text on GET /metrics (needs the prometheus_client package, without it nothing is recorded)
+- Per route latency (route template, method, status), and the SQL statements each request ran and the time they took
+- Upstream calls per val.py fetcher (each HTTP attempt: latency and status, 'error' for connection errors/timeouts)
+- Cache hits and misses per key space (view/, tag-version/, heatmap/, ...)
+- How long requests wait to check a connection out of the SQLAlchemy pool (postgres, sqlite doesn't pool)
+- Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR and /metrics adds them up across workers,
+  gunicorn.conf.py sets the directory up and cleans up after workers that exit
+'''
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+
+if prometheus_client is not None:
+    REQUEST_LATENCY = Histogram('silverwolf_request_duration_seconds', 'Time to answer a request', ['method', 'route', 'status'], buckets=LATENCY_BUCKETS)
+    REQUEST_SQL_QUERIES = Histogram('silverwolf_request_sql_queries', 'SQL statements run per request', ['route'], buckets=QUERY_COUNT_BUCKETS)
+    REQUEST_SQL_SECONDS = Histogram('silverwolf_request_sql_duration_seconds', 'Time spent in SQL statements per request', ['route'], buckets=LATENCY_BUCKETS)
+    UPSTREAM_LATENCY = Histogram('silverwolf_upstream_request_duration_seconds', 'Upstream HTTP attempts', ['function'], buckets=LATENCY_BUCKETS)
+    UPSTREAM_RESPONSES = Counter('silverwolf_upstream_responses_total', 'Upstream HTTP attempts by status', ['function', 'status'])
+    CACHE_REQUESTS = Counter('silverwolf_cache_requests_total', 'Cache lookups', ['keyspace', 'result'])
+    POOL_CHECKOUT_WAIT = Histogram('silverwolf_db_pool_checkout_wait_seconds', 'Time to check a connection out of the pool', buckets=POOL_WAIT_BUCKETS)
+    POOL_CHECKOUT_TIMEOUTS = Counter('silverwolf_db_pool_checkout_timeouts_total', 'Pool checkouts that gave up waiting')
+
+def init_app(app, cache):
+    if prometheus_client is None:
+        return
+
+    # before db.init_app, which creates the engine
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if uri and make_url(uri).get_backend_name() != 'sqlite':
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).setdefault('poolclass', TimedQueuePool)
+
+    # registered before the other after_request handlers, so it runs last and the time includes them (etags, compression)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    _count_cache_lookups(app.extensions['cache'][cache])
+
+# Request latency and per request SQL totals
+
+def _start_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_sql = [0, 0.0]
+
+def _route() -> str:
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def _observe_request(status: int):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    route = _route()
+    REQUEST_LATENCY.labels(request.method, route, str(status)).observe(time.perf_counter() - start)
+    queries, seconds = g.pop('metrics_sql', (0, 0.0))
+    REQUEST_SQL_QUERIES.labels(route).observe(queries)
+    REQUEST_SQL_SECONDS.labels(route).observe(seconds)
+
+def _finish_request(response):
+    _observe_request(response.status_code)
+    return response
+
+# after_request doesn't run for unhandled errors, those count as 500s here
+
+def _teardown_request(error):
+    if error is not None:
+        _observe_request(500)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if has_request_context() and 'metrics_sql' in g:
+        g.metrics_sql[0] += 1
+        g.metrics_sql[1] += elapsed
+
+# Cache lookups, counted on the backend so cached views, tag versions and everything else are covered
+
+def _keyspace(key) -> str:
+    key = str(key)
+    return key.split('/', 1)[0] if '/' in key else 'other'
+
+def _count_cache_lookups(backend):
+    get, get_many = backend.get, backend.get_many
+
+    @functools.wraps(get)
+    def counted_get(key):
+        value = get(key)
+        CACHE_REQUESTS.labels(_keyspace(key), 'miss' if value is None else 'hit').inc()
+        return value
+
+    @functools.wraps(get_many)
+    def counted_get_many(*keys):
+        values = get_many(*keys)
+        for key, value in zip(keys, values):
+            CACHE_REQUESTS.labels(_keyspace(key), 'miss' if value is None else 'hit').inc()
+        return values
+
+    backend.get, backend.get_many = counted_get, counted_get_many
+
+# QueuePool that times how long a checkout waits for a free connection
+
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            POOL_CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+# Upstream attempts, called by upstream.py
+
+def observe_upstream(function: str, status, seconds: float):
+    if prometheus_client is None:
+        return
+    UPSTREAM_LATENCY.labels(function).observe(seconds)
+    UPSTREAM_RESPONSES.labels(function, str(status)).inc()
+
+# The /metrics body and content type, summed over every worker's samples in multiprocess mode
+
+def render() -> Optional[Tuple[bytes, str]]:
+    if prometheus_client is None:
+        return None
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,105 @@
+"""baseline schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+The tables as they were before migrations, an existing database is stamped at this revision instead of running it
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'valorant_player',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('puuid', sa.String(), nullable=False, unique=True),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('tag', sa.String(), nullable=False),
+        sa.Column('region', sa.String(), nullable=False),
+        sa.Column('account_level', sa.Integer(), nullable=False),
+        sa.Column('card', sa.String(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False)
+    )
+    op.create_table(
+        'mmr_history',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('match_id', sa.String(), nullable=False),
+        sa.Column('puuid', sa.String(), nullable=False),
+        sa.Column('mmr_change', sa.Integer(), nullable=False),
+        sa.Column('refunded_rr', sa.Integer(), nullable=False),
+        sa.Column('was_derank_protected', sa.Integer(), nullable=False),
+        sa.Column('map', sa.String(), nullable=False),
+        sa.Column('account_rank', sa.String(), nullable=False),
+        sa.Column('account_rr', sa.Integer(), nullable=False),
+        sa.Column('account_rank_img', sa.String(), nullable=False),
+        sa.Column('date', sa.Integer(), nullable=False)
+    )
+    op.create_table(
+        'competitive_match',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('match_id', sa.String(), nullable=False, unique=True),
+        sa.Column('map', sa.String(), nullable=False),
+        sa.Column('game_length', sa.Integer(), nullable=False),
+        sa.Column('game_start', sa.Integer(), nullable=False),
+        sa.Column('region', sa.String(), nullable=False),
+        sa.Column('server', sa.String(), nullable=False),
+        sa.Column('blue_score', sa.Integer(), nullable=False),
+        sa.Column('red_score', sa.Integer(), nullable=False),
+        sa.Column('who_won', sa.String(), nullable=False)
+    )
+    op.create_table(
+        'competitive_match_player',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('match_id', sa.Integer(), sa.ForeignKey('competitive_match.id'), nullable=False),
+        sa.Column('puuid', sa.String(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('tag', sa.String(), nullable=False),
+        sa.Column('agent', sa.String(), nullable=False),
+        sa.Column('party_id', sa.String(), nullable=False),
+        sa.Column('team', sa.String(), nullable=False),
+        sa.Column('score', sa.Integer(), nullable=False),
+        sa.Column('kills', sa.Integer(), nullable=False),
+        sa.Column('deaths', sa.Integer(), nullable=False),
+        sa.Column('assists', sa.Integer(), nullable=False),
+        sa.Column('headshots', sa.Integer(), nullable=False),
+        sa.Column('bodyshots', sa.Integer(), nullable=False),
+        sa.Column('legshots', sa.Integer(), nullable=False),
+        sa.Column('damage_dealt', sa.Integer(), nullable=False),
+        sa.Column('damage_received', sa.Integer(), nullable=False),
+        sa.Column('c_ability', sa.Integer(), nullable=False),
+        sa.Column('e_ability', sa.Integer(), nullable=False),
+        sa.Column('q_ability', sa.Integer(), nullable=False),
+        sa.Column('x_ability', sa.Integer(), nullable=False)
+    )
+    op.create_table(
+        'competitive_match_kills',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('match_id', sa.Integer(), sa.ForeignKey('competitive_match.id'), nullable=False),
+        sa.Column('time_in_round', sa.Integer(), nullable=False),
+        sa.Column('round', sa.Integer(), nullable=False),
+        sa.Column('killer_puuid', sa.String(), nullable=False),
+        sa.Column('victim_puuid', sa.String(), nullable=False),
+        sa.Column('killer_x', sa.Integer(), nullable=False),
+        sa.Column('killer_y', sa.Integer(), nullable=False),
+        sa.Column('victim_x', sa.Integer(), nullable=False),
+        sa.Column('victim_y', sa.Integer(), nullable=False),
+        sa.Column('killer_view', sa.Double(), nullable=False),
+        sa.Column('weapon_id', sa.String(), nullable=False),
+        sa.Column('assistants', sa.ARRAY(sa.String()).with_variant(sa.JSON(), 'sqlite'), nullable=False)
+    )
+
+
+def downgrade():
+    op.drop_table('competitive_match_kills')
+    op.drop_table('competitive_match_player')
+    op.drop_table('competitive_match')
+    op.drop_table('mmr_history')
+    op.drop_table('valorant_player')
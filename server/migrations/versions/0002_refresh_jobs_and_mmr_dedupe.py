@@ -0,0 +1,59 @@
+"""refresh_job queue, mmr_history (puuid, match_id) uniqueness, valorant_player.last_refreshed_at
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('valorant_player', sa.Column('last_refreshed_at', sa.Integer(), nullable=False, server_default='0'))
+
+    # rows stored twice before ON CONFLICT ingest, keep the first of each
+    op.execute(
+        'DELETE FROM mmr_history WHERE id NOT IN '
+        '(SELECT MIN(id) FROM mmr_history GROUP BY puuid, match_id)'
+    )
+    with op.batch_alter_table('mmr_history') as batch_op:
+        batch_op.create_unique_constraint('uq_mmr_history_puuid_match_id', ['puuid', 'match_id'])
+
+    op.create_table(
+        'refresh_job',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('run_after', sa.Integer(), nullable=False),
+        sa.Column('locked_at', sa.Integer(), nullable=True),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.Column('created_at', sa.Integer(), nullable=False)
+    )
+    op.create_index('ix_refresh_job_claim', 'refresh_job', ['status', 'run_after'])
+    op.create_index(
+        'uq_refresh_job_active', 'refresh_job', ['kind', 'key'], unique=True,
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+        sqlite_where=sa.text("status IN ('queued', 'running')")
+    )
+
+
+def downgrade():
+    op.drop_index('uq_refresh_job_active', table_name='refresh_job')
+    op.drop_index('ix_refresh_job_claim', table_name='refresh_job')
+    op.drop_table('refresh_job')
+
+    with op.batch_alter_table('mmr_history') as batch_op:
+        batch_op.drop_constraint('uq_mmr_history_puuid_match_id', type_='unique')
+
+    with op.batch_alter_table('valorant_player') as batch_op:
+        batch_op.drop_column('last_refreshed_at')
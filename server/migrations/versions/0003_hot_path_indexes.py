@@ -0,0 +1,40 @@
+"""indexes for the hot query paths
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+On postgres the indexes are built CONCURRENTLY so a live database keeps taking writes while they build
+(that can't run in a transaction, hence the autocommit block)
+"""
+from alembic import op
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_valorant_player_name_tag', 'valorant_player', ['name', 'tag']),
+    ('ix_mmr_history_puuid_date', 'mmr_history', ['puuid', 'date', 'id']),
+    ('ix_mmr_history_date', 'mmr_history', ['date', 'id']),
+    ('ix_competitive_match_game_start', 'competitive_match', ['game_start', 'id']),
+    ('ix_competitive_match_player_puuid', 'competitive_match_player', ['puuid', 'match_id']),
+    ('ix_competitive_match_player_match_id', 'competitive_match_player', ['match_id']),
+    ('ix_competitive_match_kills_match_id', 'competitive_match_kills', ['match_id'])
+]
+
+
+def upgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=postgresql, if_not_exists=True)
+
+
+def downgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=postgresql, if_exists=True)
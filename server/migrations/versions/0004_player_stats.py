@@ -0,0 +1,52 @@
+"""player_stats running totals, filled from the matches already stored
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+COUNTERS = ['matches', 'wins', 'ties', 'rounds', 'score', 'kills', 'deaths', 'assists',
+            'headshots', 'bodyshots', 'legshots', 'damage_dealt', 'damage_received']
+
+# same totals ingest.add_to_player_stats adds up match by match
+BACKFILL = '''
+INSERT INTO player_stats (puuid, scope, scope_value, {counters})
+SELECT p.puuid, '{scope}', {scope_value},
+    COUNT(*),
+    SUM(CASE WHEN p.team = m.who_won THEN 1 ELSE 0 END),
+    SUM(CASE WHEN m.who_won = 'tie' THEN 1 ELSE 0 END),
+    SUM(m.blue_score + m.red_score),
+    SUM(p.score), SUM(p.kills), SUM(p.deaths), SUM(p.assists),
+    SUM(p.headshots), SUM(p.bodyshots), SUM(p.legshots), SUM(p.damage_dealt), SUM(p.damage_received)
+FROM competitive_match_player p JOIN competitive_match m ON m.id = p.match_id
+GROUP BY p.puuid{group_by}
+'''
+
+
+def upgrade():
+    op.create_table(
+        'player_stats',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('puuid', sa.String(), nullable=False),
+        sa.Column('scope', sa.String(), nullable=False),
+        sa.Column('scope_value', sa.String(), nullable=False),
+        *[sa.Column(counter, sa.Integer(), nullable=False) for counter in COUNTERS],
+        sa.UniqueConstraint('puuid', 'scope', 'scope_value', name='uq_player_stats_puuid_scope_value')
+    )
+
+    counters = ', '.join(COUNTERS)
+    op.execute(BACKFILL.format(counters=counters, scope='overall', scope_value="''", group_by=''))
+    op.execute(BACKFILL.format(counters=counters, scope='agent', scope_value='p.agent', group_by=', p.agent'))
+    op.execute(BACKFILL.format(counters=counters, scope='map', scope_value='m.map', group_by=', m.map'))
+
+
+def downgrade():
+    op.drop_table('player_stats')
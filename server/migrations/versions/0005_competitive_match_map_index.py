@@ -0,0 +1,25 @@
+"""competitive_match (map) index for /heatmap
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        op.create_index('ix_competitive_match_map', 'competitive_match', ['map'], postgresql_concurrently=postgresql, if_not_exists=True)
+
+
+def downgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_competitive_match_map', table_name='competitive_match', postgresql_concurrently=postgresql, if_exists=True)
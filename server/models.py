@@ -1,12 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Integer, String, ARRAY
+from sqlalchemy import Integer, String, ARRAY, JSON, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from typing import List
+from typing import List, Optional
 
 db = SQLAlchemy()
 
 class Valorant_Player(db.Model):
     __tablename__ = "valorant_player"
+    __table_args__ = (db.Index("ix_valorant_player_name_tag", "name", "tag"),)
     id: Mapped[int] = mapped_column(primary_key=True)
     puuid: Mapped[str] = mapped_column(unique=True)
     name: Mapped[str]
@@ -15,9 +16,15 @@ class Valorant_Player(db.Model):
     account_level: Mapped[int] = mapped_column(default=0)
     card: Mapped[str]
     title: Mapped[str]
+    last_refreshed_at: Mapped[int] = mapped_column(default=0, server_default="0")
 
 class MMR_History(db.Model):
     __tablename__ = "mmr_history"
+    __table_args__ = (
+        db.UniqueConstraint("puuid", "match_id", name="uq_mmr_history_puuid_match_id"),
+        db.Index("ix_mmr_history_puuid_date", "puuid", "date", "id"),
+        db.Index("ix_mmr_history_date", "date", "id"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     match_id: Mapped[str]
     puuid: Mapped[str]
@@ -32,6 +39,10 @@ class MMR_History(db.Model):
 
 class Competitive_Match(db.Model):
     __tablename__ = "competitive_match"
+    __table_args__ = (
+        db.Index("ix_competitive_match_game_start", "game_start", "id"),
+        db.Index("ix_competitive_match_map", "map"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     match_id: Mapped[str] = mapped_column(unique=True)
     map: Mapped[str]
@@ -47,6 +58,10 @@ class Competitive_Match(db.Model):
 
 class Competitive_Match_Player(db.Model):
     __tablename__ = "competitive_match_player"
+    __table_args__ = (
+        db.Index("ix_competitive_match_player_puuid", "puuid", "match_id"),
+        db.Index("ix_competitive_match_player_match_id", "match_id"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True)
     match_id: Mapped[int] = mapped_column(db.ForeignKey("competitive_match.id"))
     puuid: Mapped[str]
@@ -73,6 +88,7 @@ class Competitive_Match_Player(db.Model):
 
 class Competitive_Match_Kill(db.Model):
     __tablename__ = "competitive_match_kills"
+    __table_args__ = (db.Index("ix_competitive_match_kills_match_id", "match_id"),)
     id: Mapped[int] = mapped_column(primary_key=True)
     match_id: Mapped[int] = mapped_column(db.ForeignKey("competitive_match.id"))
     time_in_round: Mapped[int]
@@ -85,6 +101,51 @@ class Competitive_Match_Kill(db.Model):
     victim_y: Mapped[int]
     killer_view: Mapped[float]
     weapon_id: Mapped[str]
-    assistants: Mapped[List[str]] = mapped_column(ARRAY(String))
+    assistants: Mapped[List[str]] = mapped_column(ARRAY(String).with_variant(JSON, "sqlite"))
 
-    match = relationship("Competitive_Match", back_populates="match_kills")
\ No newline at end of file
+    match = relationship("Competitive_Match", back_populates="match_kills")
+
+class Refresh_Job(db.Model):
+    __tablename__ = "refresh_job"
+    __table_args__ = (
+        db.Index("ix_refresh_job_claim", "status", "run_after"),
+        # only one queued/running job per thing to refresh, enqueueing it again is a no-op
+        db.Index("uq_refresh_job_active", "kind", "key", unique=True,
+                 postgresql_where=text("status IN ('queued', 'running')"),
+                 sqlite_where=text("status IN ('queued', 'running')")),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str]
+    key: Mapped[str]
+    payload: Mapped[dict] = mapped_column(JSON)
+    priority: Mapped[int] = mapped_column(default=0)
+    status: Mapped[str] = mapped_column(default="queued")
+    attempts: Mapped[int] = mapped_column(default=0)
+    run_after: Mapped[int]
+    locked_at: Mapped[Optional[int]]
+    last_error: Mapped[Optional[str]]
+    created_at: Mapped[int]
+
+# Running totals over a player's stored matches (competitive_match_player rows), kept up to date by ingest.persist_match
+# One row per player for scope 'overall' (scope_value ''), plus one per agent ('agent') and per map ('map') they played
+
+class Player_Stats(db.Model):
+    __tablename__ = "player_stats"
+    __table_args__ = (db.UniqueConstraint("puuid", "scope", "scope_value", name="uq_player_stats_puuid_scope_value"),)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    puuid: Mapped[str]
+    scope: Mapped[str]
+    scope_value: Mapped[str]
+    matches: Mapped[int] = mapped_column(default=0)
+    wins: Mapped[int] = mapped_column(default=0)
+    ties: Mapped[int] = mapped_column(default=0)
+    rounds: Mapped[int] = mapped_column(default=0)
+    score: Mapped[int] = mapped_column(default=0)
+    kills: Mapped[int] = mapped_column(default=0)
+    deaths: Mapped[int] = mapped_column(default=0)
+    assists: Mapped[int] = mapped_column(default=0)
+    headshots: Mapped[int] = mapped_column(default=0)
+    bodyshots: Mapped[int] = mapped_column(default=0)
+    legshots: Mapped[int] = mapped_column(default=0)
+    damage_dealt: Mapped[int] = mapped_column(default=0)
+    damage_received: Mapped[int] = mapped_column(default=0)
@@ -0,0 +1,79 @@
+import json
+import base64
+
+from flask import request
+from sqlalchemy import tuple_, desc, asc
+
+from typing import List, Optional, Tuple
+
+'''
+Keyset (cursor) pagination for endpoints whose result sets grow with the tables
+- Pages are fetched with WHERE (sort, id) < (last sort, last id) so every page costs the same, no OFFSET scans
+- Cursors are opaque to clients: base64 of the sort values of the last row on the page
+- Every paginated sort column is an integer (ids, unix times), so cursors only ever hold ints
+'''
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+class InvalidPageArgs(ValueError):
+    pass
+
+def encode_cursor(values: List) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str, size: int) -> List:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise InvalidPageArgs(f'{cursor} is not a valid cursor')
+
+    # bool is an int subclass, but never a sort value
+    if not isinstance(values, list) or len(values) != size or any(type(value) is not int for value in values):
+        raise InvalidPageArgs(f'{cursor} is not a valid cursor')
+    return values
+
+# Read ?limit= and ?cursor= from the request (limit is None when there is no default and none was given)
+
+def get_page_args(size: int, default_limit: Optional[int] = DEFAULT_LIMIT, max_limit: Optional[int] = MAX_LIMIT) -> Tuple[Optional[int], Optional[List]]:
+    limit = default_limit
+    if request.args.get('limit') is not None:
+        try:
+            limit = int(request.args['limit'])
+        except ValueError:
+            raise InvalidPageArgs('limit must be a number')
+        if limit < 1:
+            raise InvalidPageArgs('limit must be at least 1')
+
+    if limit is not None and max_limit is not None:
+        limit = min(limit, max_limit)
+
+    cursor = request.args.get('cursor')
+    return limit, decode_cursor(cursor, size) if cursor else None
+
+# Order a query over `columns` (last one must be unique, i.e. the id) and skip everything up to the cursor
+
+def order_page(query, columns, cursor: Optional[List], descending: bool = True):
+    if cursor is not None:
+        if descending:
+            query = query.filter(tuple_(*columns) < tuple_(*cursor))
+        else:
+            query = query.filter(tuple_(*columns) > tuple_(*cursor))
+
+    order = desc if descending else asc
+    return query.order_by(*[order(column) for column in columns])
+
+def row_cursor(row, columns) -> str:
+    return encode_cursor([getattr(row, column.key) for column in columns])
+
+# Returns the rows of this page and the cursor for the next one (None on the last page)
+
+def paginate(query, columns, descending: bool = True) -> Tuple[List, Optional[str]]:
+    limit, cursor = get_page_args(len(columns))
+    rows = order_page(query, columns, cursor, descending).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = row_cursor(rows[-1], columns)
+    return rows, next_cursor
@@ -0,0 +1,88 @@
+from flask import request
+from sqlalchemy.orm import selectinload, raiseload
+
+from models import Competitive_Match
+
+from typing import Dict, FrozenSet, NamedTuple, Optional
+
+'''
+Field projection for the match endpoints, most clients only want the scoreboard and the kill list is most of a match
+- ?include=players,kills picks which lists come with each match (players, kills, both, or none), default both
+- ?fields=match_id,map,... keeps only those match fields (match_players/match_kills count as fields too, when ?include= isn't given)
+- Lists that aren't included are never loaded: no selectinload for them, and a raiseload so touching one by accident fails loudly
+'''
+
+MATCH_FIELDS = ['match_id', 'map', 'game_length', 'game_start', 'region', 'server', 'blue_score', 'red_score', 'who_won']
+
+# ?include= name -> match dict key and relationship
+
+MATCH_LISTS = {
+    'players': ('match_players', Competitive_Match.match_players),
+    'kills': ('match_kills', Competitive_Match.match_kills)
+}
+
+class InvalidProjection(ValueError):
+    pass
+
+class MatchProjection(NamedTuple):
+    fields: Optional[FrozenSet[str]]   # None keeps every match field
+    include: FrozenSet[str]            # keys of MATCH_LISTS
+
+    def has(self, field: str) -> bool:
+        return self.fields is None or field in self.fields
+
+FULL_MATCH = MatchProjection(None, frozenset(MATCH_LISTS))
+
+# Args read as comma lists, order, repeats and empty parts don't change what they select and blank is missing (cache_tags.py keys them that way)
+
+LIST_ARGS = ('fields', 'include')
+
+# None when the arg is missing or blank (?fields= asks for nothing in particular, ?include=none is how to leave both lists out)
+
+def _arg_list(name: str) -> Optional[list]:
+    parts = [part.strip() for value in request.args.getlist(name) for part in value.split(',') if part.strip()]
+    return parts or None
+
+# Read ?fields= and ?include= from the request
+
+def get_match_projection() -> MatchProjection:
+    fields = _arg_list('fields')
+    include = _arg_list('include')
+
+    list_keys = {key: name for name, (key, _) in MATCH_LISTS.items()}
+    if fields is not None:
+        unknown = [field for field in fields if field not in MATCH_FIELDS and field not in list_keys]
+        if unknown:
+            raise InvalidProjection(f'unknown fields {", ".join(unknown)}, pick from {", ".join(MATCH_FIELDS + list(list_keys))}')
+
+    if include is not None:
+        include = [name for name in include if name != 'none']
+        unknown = [name for name in include if name not in MATCH_LISTS]
+        if unknown:
+            raise InvalidProjection(f'can only include {", ".join(MATCH_LISTS)} (or none), not {", ".join(unknown)}')
+    elif fields is not None:
+        include = [list_keys[field] for field in fields if field in list_keys]
+    else:
+        include = list(MATCH_LISTS)
+
+    return MatchProjection(
+        frozenset(field for field in fields if field in MATCH_FIELDS) if fields is not None else None,
+        frozenset(include)
+    )
+
+# Loader options for a Competitive_Match query: one selectinload per included list, nothing loads the others
+
+def match_loaders(projection: MatchProjection):
+    return [
+        selectinload(relationship) if name in projection.include else raiseload(relationship)
+        for name, (_, relationship) in MATCH_LISTS.items()
+    ]
+
+# Project a match dict in the val.get_match_info format, into a new dict (the one passed in may be shared, see upstream.single_flight)
+
+def project_match(match: Dict, projection: MatchProjection) -> Dict:
+    projected = {field: match.get(field) for field in MATCH_FIELDS if projection.has(field)}
+    for name, (key, _) in MATCH_LISTS.items():
+        if name in projection.include:
+            projected[key] = match[key]
+    return projected
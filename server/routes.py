@@ -1,9 +1,25 @@
-from app import app, cache
-from sqlalchemy import select, desc
-from models import db, Valorant_Player, MMR_History, Competitive_Match, Competitive_Match_Kill, Competitive_Match_Player
-from flask import request
+import time
+import asyncio
+
+from app import app
+from sqlalchemy import select, desc, or_, tuple_
+from sqlalchemy.exc import IntegrityError
+from models import db, Valorant_Player, MMR_History, Competitive_Match, Competitive_Match_Kill, Competitive_Match_Player, Player_Stats
+from flask import request, send_file, Response
 
 import val
+import ingest
+import serializers
+import pagination
+import streaming
+import jobs
+import cache_tags
+import upstream
+import heatmap
+import export
+import backfill
+import projection
+import metrics
 
 '''
 The goal of v2 is to move all updating to a separate instance/program to completely reduce overhead and to provide information better
@@ -11,20 +27,53 @@ The goal of v2 is to move all updating to a separate instance/program to complet
 - Instead of having to create updaters we can just cache returned data until it can potentially update (5 minute simple cache, move to redis in future)
 '''
 
+@app.errorhandler(upstream.UpstreamUnavailable)
+def upstream_unavailable(error):
+    return {
+        'error': '<p>The Valorant API is busy right now, try again shortly</p>'
+    }, 503, {'Retry-After': str(max(int(error.retry_after), 1))}
+
+@app.errorhandler(backfill.PlayerNotFound)
+def backfill_player_not_found(error):
+    return {'error': f'<p>{error} is not in the db yet!</p>'}, 404
+
+@app.errorhandler(pagination.InvalidPageArgs)
+def invalid_page_args(error):
+    return {'error': f'<p>{error}</p>'}, 400
+
+@app.errorhandler(projection.InvalidProjection)
+def invalid_projection(error):
+    return {'error': f'<p>{error}</p>'}, 400
+
 @app.route('/')
 def hello_world():
     return '<p>Hello, World!</p>'
 
+@app.route('/upstream/stats')
+def get_upstream_stats():
+    return {'data': {'single_flight': upstream.single_flight_stats()}}
+
+# Prometheus text format, summed over every gunicorn worker (see metrics.py)
+
+@app.route('/metrics')
+def get_metrics():
+    rendered = metrics.render()
+    if rendered is None:
+        return {'error': '<p>metrics need the prometheus_client package</p>'}, 501
+    body, content_type = rendered
+    return Response(body, content_type=content_type)
+
+# Pages don't carry the total, counting the whole table on every page would grow with it (?count_only=true for that)
+
 @app.route('/users')
 def get_all_users_v2():
-    player_list = Valorant_Player.query.all()
     count_only: bool = str(request.args.get('count_only')).lower() == 'true'
     if count_only:
         return {'data': {'total_users': Valorant_Player.query.count()}}
     else:
+        player_list, next_cursor = pagination.paginate(Valorant_Player.query, [Valorant_Player.id], descending=False)
         return {
             'data':{
-                'total_users': len(player_list),
                 'players': [
                     {
                         'name': player.name,
@@ -32,12 +81,62 @@ def get_all_users_v2():
                         'puuid': player.puuid,
                         'region': player.region
                     } for player in player_list
-                ]
+                ],
+                'next_cursor': next_cursor
             }
         }
 
+# Queued (202) responses go stale as soon as the worker gets to them, so they are never cached
+
+def is_cacheable(response) -> bool:
+    return response.status_code != 202
+
+def queued_response(what: str):
+    return {
+        'status': 'queued',
+        'message': f'<p>{what} is being fetched, try again shortly</p>'
+    }, 202
+
+def player_to_dict(player: Valorant_Player) -> dict:
+    return {
+        'name': player.name,
+        'tag': player.tag,
+        'puuid': player.puuid,
+        'region': player.region,
+        'account_level': player.account_level,
+        'card': val.get_player_card(player.card!=None, player.card),
+        'title': val.get_title(player.title!=None, player.title),
+        'last_refreshed_at': player.last_refreshed_at,
+        'is_stale': is_player_stale(player)
+    }
+
+def player_response(player: Valorant_Player):
+    return {
+        'data': player_to_dict(player)
+    }
+
+def is_player_stale(player: Valorant_Player) -> bool:
+    return time.time() - player.last_refreshed_at > app.config['PLAYER_FRESHNESS_SECONDS']
+
+# Stale-while-revalidate: stale profiles are still served, the worker refreshes them in the background
+
+def refresh_player_if_stale(player: Valorant_Player):
+    if is_player_stale(player):
+        jobs.enqueue_player_refresh(player.puuid)
+        db.session.commit()
+
+# Store a freshly fetched player (they may already be stored under an old name#tag)
+
+def store_fetched_player(player_info) -> Valorant_Player:
+    query = select(Valorant_Player).where(
+        Valorant_Player.puuid == player_info['puuid']
+    )
+    player = ingest.store_player(player_info, db.session.execute(query).scalar_one_or_none())
+    db.session.commit()
+    return player
+
 @app.route('/users/<name>/<tag>')
-@cache.cached(timeout=300)
+@cache_tags.cached_view(lambda name, tag: cache_tags.player_tags(name=name, tag=tag), timeout=300, response_filter=is_cacheable)
 async def get_player_by_username_v2(name, tag):
     query = select(Valorant_Player).where(
         Valorant_Player.name == name,
@@ -46,62 +145,23 @@ async def get_player_by_username_v2(name, tag):
     existing_player = db.session.execute(query).scalar_one_or_none()
 
     if existing_player:
-        player_info = await val.get_verbose_player_stats(existing_player.puuid)
-
-        existing_player.name = player_info['name']
-        existing_player.tag = player_info['tag']
-        existing_player.region = player_info['region']
-        existing_player.account_level = player_info['account_level']
-        existing_player.title = player_info['title']
-        existing_player.card = player_info['card']
-
+        refresh_player_if_stale(existing_player)
+        return player_response(existing_player)
+    elif not app.config['INLINE_COLD_FETCH']:
+        jobs.enqueue_player_refresh(name=name, tag=tag, priority=jobs.PRIORITY_HIGH)
         db.session.commit()
-
-        return {
-            'data': 
-                {
-                    'name': existing_player.name,
-                    'tag': existing_player.tag,
-                    'puuid': existing_player.puuid,
-                    'region': existing_player.region,
-                    'account_level': existing_player.account_level,
-                    'card': val.get_player_card(existing_player.card!=None, existing_player.card),
-                    'title': await val.get_title(existing_player.title!=None, existing_player.title)
-                }
-            }
+        return queued_response(f'{name}#{tag}')
     else:
         player_info = await val.get_player_stats(name, tag)
         if player_info:
-            new_player = Valorant_Player(
-                name = player_info['name'],
-                tag = player_info['tag'],
-                puuid = player_info['puuid'],
-                region = player_info['region'],
-                account_level = player_info['account_level'],
-                title = player_info['title'],
-                card = player_info['card']
-            )
-            db.session.add(new_player)
-            db.session.commit()
-            return {
-                'data': 
-                    {
-                        'name': new_player.name,
-                        'tag': new_player.tag,
-                        'puuid': new_player.puuid,
-                        'region': new_player.region,
-                        'account_level': new_player.account_level,
-                        'card': val.get_player_card(new_player.card!=None, new_player.card),
-                        'title': await val.get_title(new_player.title!=None, new_player.title)
-                    }
-                }
+            return player_response(store_fetched_player(player_info))
         else:
             return {
                 'error': f'<p>{name}#{tag} is not a valid player</p>'
             }, 404
 
 @app.route('/by-puuid/users/<puuid>')
-@cache.cached(timeout=300)
+@cache_tags.cached_view(lambda puuid: cache_tags.player_tags(puuid), timeout=300, response_filter=is_cacheable)
 async def get_player_by_puuid_v2(puuid):
     query = select(Valorant_Player).where(
         Valorant_Player.puuid == puuid
@@ -109,62 +169,127 @@ async def get_player_by_puuid_v2(puuid):
 
     existing_player = db.session.execute(query).scalar_one_or_none()
     if existing_player:
-        player_info = await val.get_verbose_player_stats(existing_player.puuid)
-
-        existing_player.name = player_info['name']
-        existing_player.tag = player_info['tag']
-        existing_player.region = player_info['region']
-        existing_player.account_level = player_info['account_level']
-        existing_player.title = player_info['title']
-        existing_player.card = player_info['card']
-
+        refresh_player_if_stale(existing_player)
+        return player_response(existing_player)
+    elif not app.config['INLINE_COLD_FETCH']:
+        jobs.enqueue_player_refresh(puuid, priority=jobs.PRIORITY_HIGH)
         db.session.commit()
-
-        return {
-            'data': 
-                {
-                    'name': existing_player.name,
-                    'tag': existing_player.tag,
-                    'puuid': existing_player.puuid,
-                    'region': existing_player.region,
-                    'account_level': existing_player.account_level,
-                    'card': val.get_player_card(existing_player.card!=None, existing_player.card),
-                    'title': await val.get_title(existing_player.title!=None, existing_player.title)
-                }
-            }
+        return queued_response(puuid)
     else:
         player_info = await val.get_verbose_player_stats(puuid)
         if player_info:
-            new_player = Valorant_Player(
-                name = player_info['name'],
-                tag = player_info['tag'],
-                puuid = player_info['puuid'],
-                region = player_info['region'],
-                account_level = player_info['account_level'],
-                title = player_info['title'],
-                card = player_info['card']
-            )
-            db.session.add(new_player)
-            db.session.commit()
-            return {
-                'data': 
-                    {
-                        'name': new_player.name,
-                        'tag': new_player.tag,
-                        'puuid': new_player.puuid,
-                        'region': new_player.region,
-                        'account_level': new_player.account_level,
-                        'card': val.get_player_card(new_player.card!=None, new_player.card),
-                        'title': await val.get_title(new_player.title!=None, new_player.title)
-                    }
-                }
+            return player_response(store_fetched_player(player_info))
         else:
             return {
                 'error': f'<p>{puuid} is not a valid player</p>'
             }, 404
 
+# Split a batch identifier into (puuid, None) or (name, tag) for name#tag
+
+def parse_player_identifier(identifier: str):
+    if '#' in identifier:
+        name, tag = identifier.rsplit('#', 1)
+        return name, tag
+    return identifier, None
+
+async def fetch_player(identifier: str):
+    name_or_puuid, tag = parse_player_identifier(identifier)
+    if tag is None:
+        return await val.get_verbose_player_stats(name_or_puuid)
+    return await val.get_player_stats(name_or_puuid, tag)
+
+# Many players in one request: {"players": ["<puuid>", "<name>#<tag>", ...]}, answered as {"data": {"<identifier>": {...}}}
+# Stored players come from one query, the missing ones are fetched from upstream concurrently (or queued without INLINE_COLD_FETCH)
+
+@app.route('/users/batch', methods=['POST'])
+async def get_players_batch_v2():
+    body = request.get_json(silent=True) or {}
+    identifiers = body.get('players')
+    if not isinstance(identifiers, list) or not identifiers or not all(isinstance(identifier, str) and identifier for identifier in identifiers):
+        return {'error': '<p>players must be a non-empty list of puuids or name#tag strings</p>'}, 400
+    identifiers = list(dict.fromkeys(identifiers))
+    if len(identifiers) > app.config['BATCH_LOOKUP_MAX_PLAYERS']:
+        return {'error': f'<p>at most {app.config["BATCH_LOOKUP_MAX_PLAYERS"]} players per batch</p>'}, 400
+
+    puuids, name_tags = [], []
+    for identifier in identifiers:
+        name_or_puuid, tag = parse_player_identifier(identifier)
+        if tag is None:
+            puuids.append(name_or_puuid)
+        else:
+            name_tags.append((name_or_puuid, tag))
+
+    conditions = []
+    if puuids:
+        conditions.append(Valorant_Player.puuid.in_(puuids))
+    if name_tags:
+        conditions.append(tuple_(Valorant_Player.name, Valorant_Player.tag).in_(name_tags))
+    stored_players = db.session.execute(select(Valorant_Player).where(or_(*conditions))).scalars().all()
+
+    players = {}
+    for player in stored_players:
+        players[player.puuid] = player
+        players[f'{player.name}#{player.tag}'] = player
+
+    result = {'data': {}, 'not_found': [], 'queued': [], 'unavailable': []}
+    missing = [identifier for identifier in identifiers if identifier not in players]
+
+    for player in stored_players:
+        if is_player_stale(player):
+            jobs.enqueue_player_refresh(player.puuid)
+
+    if missing and not app.config['INLINE_COLD_FETCH']:
+        for identifier in missing:
+            name_or_puuid, tag = parse_player_identifier(identifier)
+            if tag is None:
+                jobs.enqueue_player_refresh(name_or_puuid, priority=jobs.PRIORITY_HIGH)
+            else:
+                jobs.enqueue_player_refresh(name=name_or_puuid, tag=tag, priority=jobs.PRIORITY_HIGH)
+        result['queued'] = missing
+    elif missing:
+        fetched = await asyncio.gather(*[fetch_player(identifier) for identifier in missing], return_exceptions=True)
+        for player_info in fetched:
+            if isinstance(player_info, Exception) and not isinstance(player_info, upstream.UpstreamUnavailable):
+                raise player_info
+
+        # fetched players may already be stored under an old name#tag, one query for those too
+        fetched_puuids = [player_info['puuid'] for player_info in fetched if isinstance(player_info, dict)]
+        existing_players = {player.puuid: player for player in db.session.execute(
+            select(Valorant_Player).where(Valorant_Player.puuid.in_(fetched_puuids))
+        ).scalars()} if fetched_puuids else {}
+
+        for identifier, player_info in zip(missing, fetched):
+            if isinstance(player_info, upstream.UpstreamUnavailable):
+                result['unavailable'].append(identifier)
+            elif player_info is None:
+                result['not_found'].append(identifier)
+            else:
+                player = ingest.store_player(player_info, existing_players.get(player_info['puuid']))
+                existing_players[player_info['puuid']] = player
+                players[identifier] = player
+
+    db.session.flush()
+    resolved = {identifier: player.puuid for identifier, player in players.items()}
+    db.session.commit()
+
+    # the commit expired them, reload them all at once instead of one refresh query each
+    players = {player.puuid: player for player in db.session.execute(
+        select(Valorant_Player).where(Valorant_Player.puuid.in_(set(resolved.values())))
+    ).scalars()} if resolved else {}
+
+    for identifier in identifiers:
+        if identifier in resolved:
+            result['data'][identifier] = player_to_dict(players[resolved[identifier]])
+    return result
+
+def has_mmr_history(puuid: str) -> bool:
+    query = select(MMR_History.id).where(
+        MMR_History.puuid == puuid
+    ).limit(1)
+    return db.session.execute(query).first() is not None
+
 @app.route('/by-puuid/mmr-history/<puuid>')
-@cache.cached(timeout=300)
+@cache_tags.cached_view(lambda puuid: cache_tags.player_tags(puuid), timeout=300, response_filter=is_cacheable)
 async def get_mmr_history_puuid_v2(puuid):
     is_player_in_basic_table_query = select(Valorant_Player).where(
         Valorant_Player.puuid == puuid
@@ -173,40 +298,25 @@ async def get_mmr_history_puuid_v2(puuid):
     existing_player = db.session.execute(is_player_in_basic_table_query).scalar_one_or_none()
     if existing_player is None:
         return {'error': f'<p>{puuid} is not in the db yet!</p>'}, 404
+    elif has_mmr_history(puuid):
+        # serve what we have, the worker adds any new matches
+        jobs.enqueue_mmr_history_refresh(existing_player.region, puuid)
+        db.session.commit()
+    elif not app.config['INLINE_COLD_FETCH']:
+        jobs.enqueue_mmr_history_refresh(existing_player.region, puuid, priority=jobs.PRIORITY_HIGH)
+        db.session.commit()
+        return queued_response(f'mmr history for {puuid}')
     else:
         mmr_history = await val.get_player_comp_mmr_history_by_puuid(existing_player.region, puuid)
 
         if mmr_history is None:
             return {'error': f'<p>{puuid} does not have a mmr history</p>'}, 404
         
-        matches_added = 0
-        for match in mmr_history:
-            is_match_in_history_table_query = select(MMR_History).where(
-                MMR_History.puuid == puuid,
-                MMR_History.match_id == match['match_id']
-            )
-
-            existing_match = db.session.execute(is_match_in_history_table_query).scalar_one_or_none()
-            if existing_match == None:
-                player_match = MMR_History(
-                    match_id = match['match_id'],
-                    puuid = puuid,
-                    mmr_change = match['mmr_change'], 
-                    refunded_rr = match['refunded_rr'],
-                    was_derank_protected= match['was_derank_protected'],
-                    map = match['map'],
-                    account_rank = match['account_rank'], 
-                    account_rr = match['account_rr'],
-                    account_rank_img = match['account_rank_img'],
-                    date = match['date']
-                )
-                db.session.add(player_match)
-                matches_added += 1
-        
+        matches_added = ingest.ingest_mmr_history(puuid, mmr_history)
         db.session.commit()
+        app.logger.info(f'Added {matches_added} matches to the db for {puuid}')
 
     matches_list = MMR_History.query.filter_by(puuid=puuid).order_by(desc(MMR_History.date)).all()
-    print(f'Added {matches_added} matches to the db')
     return {
         'matches': [
             {
@@ -224,7 +334,7 @@ async def get_mmr_history_puuid_v2(puuid):
     }
 
 @app.route('/mmr-history/<name>/<tag>')
-@cache.cached(timeout=300)
+@cache_tags.cached_view(lambda name, tag: cache_tags.player_tags(name=name, tag=tag), timeout=300, response_filter=is_cacheable)
 async def get_mmr_history_username_v2(name, tag):
     is_player_in_basic_table_query = select(Valorant_Player).where(
         Valorant_Player.name == name,
@@ -234,40 +344,25 @@ async def get_mmr_history_username_v2(name, tag):
     existing_player = db.session.execute(is_player_in_basic_table_query).scalar_one_or_none()
     if existing_player is None:
         return {'error': f'<p>{name}#{tag} is not in the db yet!</p>'}, 404
+    elif has_mmr_history(existing_player.puuid):
+        # serve what we have, the worker adds any new matches
+        jobs.enqueue_mmr_history_refresh(existing_player.region, existing_player.puuid)
+        db.session.commit()
+    elif not app.config['INLINE_COLD_FETCH']:
+        jobs.enqueue_mmr_history_refresh(existing_player.region, existing_player.puuid, priority=jobs.PRIORITY_HIGH)
+        db.session.commit()
+        return queued_response(f'mmr history for {name}#{tag}')
     else:
         mmr_history = await val.get_player_comp_mmr_history_by_username(existing_player.region, existing_player.name, existing_player.tag)
 
         if mmr_history is None:
             return {'error': f'<p>{name}#{tag} does not have a mmr history</p>'}, 404
         
-        matches_added = 0
-        for match in mmr_history:
-            is_match_in_history_table_query = select(MMR_History).where(
-                MMR_History.puuid == existing_player.puuid,
-                MMR_History.match_id == match['match_id']
-            )
-
-            existing_match = db.session.execute(is_match_in_history_table_query).scalar_one_or_none()
-            if existing_match == None:
-                player_match = MMR_History(
-                    match_id = match['match_id'],
-                    puuid = existing_player.puuid,
-                    mmr_change = match['mmr_change'], 
-                    refunded_rr = match['refunded_rr'],
-                    was_derank_protected= match['was_derank_protected'],
-                    map = match['map'],
-                    account_rank = match['account_rank'], 
-                    account_rr = match['account_rr'],
-                    account_rank_img = match['account_rank_img'],
-                    date = match['date']
-                )
-                db.session.add(player_match)
-                matches_added += 1
-        
+        matches_added = ingest.ingest_mmr_history(existing_player.puuid, mmr_history)
         db.session.commit()
+        app.logger.info(f'Added {matches_added} matches to the db for {name}#{tag}')
 
     matches_list = MMR_History.query.filter_by(puuid=existing_player.puuid).order_by(desc(MMR_History.date)).all()
-    print(f'Added {matches_added} matches to the db')
     return {
         'matches': [
             {
@@ -286,158 +381,49 @@ async def get_mmr_history_username_v2(name, tag):
 
 @app.route('/mmr-history')
 async def get_full_mmr_history_v2():
-    mmr_history = MMR_History.query.order_by(desc(MMR_History.date)).all()
+    if streaming.wants_stream():
+        return streaming.stream_page(MMR_History.query, [MMR_History.date, MMR_History.id], serializers.mmr_history_to_dict, 'matches')
+
+    mmr_history, next_cursor = pagination.paginate(MMR_History.query, [MMR_History.date, MMR_History.id])
     return {
-        'matches': [
-            {
-                'match_id': match.match_id,
-                'mmr_change': match.mmr_change,
-                'refunded_rr': match.refunded_rr,
-                'was_derank_protected': match.was_derank_protected,
-                'map': match.map,
-                'puuid': match.puuid,
-                'account_rank': match.account_rank,
-                'account_rr': match.account_rr,
-                'account_rank_img': match.account_rank_img,
-                'date': match.date
-            } for match in mmr_history
-        ]
+        'matches': [serializers.mmr_history_to_dict(match) for match in mmr_history],
+        'next_cursor': next_cursor
     }
 
 @app.route('/match/<region>/<match_id>')
-@cache.cached(timeout=300)
+@cache_tags.cached_view(lambda region, match_id: cache_tags.match_tags(match_id), timeout=300, response_filter=is_cacheable)
 async def get_match_info_v2(region, match_id):
+    match_projection = projection.get_match_projection()
     is_match_in_db_query = select(Competitive_Match).where(
         Competitive_Match.region == region.upper(),
         Competitive_Match.match_id == match_id
-    )
+    ).options(*projection.match_loaders(match_projection))
 
     existing_match = db.session.execute(is_match_in_db_query).scalar_one_or_none()
 
-    if existing_match is None:
+    if existing_match is None and not app.config['INLINE_COLD_FETCH']:
+        jobs.enqueue_match_fetch(region, match_id, priority=jobs.PRIORITY_HIGH)
+        db.session.commit()
+        return queued_response(f'match {match_id}')
+    elif existing_match is None:
         full_match_info = await val.get_match_info(region, match_id)
         if full_match_info is None:
             return {'error': f'<p>Cannot retrieve info for match: {match_id}...</p>'}, 404
         else:
-            new_match = Competitive_Match(
-                match_id = full_match_info['match_id'],
-                map = full_match_info['map'],
-                game_length = full_match_info['game_length'],
-                game_start = full_match_info['game_start'],
-                region = full_match_info['region'],
-                server = full_match_info['server'],
-                blue_score = full_match_info.get('blue_score', 0),
-                red_score = full_match_info.get('red_score', 0),
-                who_won = full_match_info['who_won']
-            )
-            db.session.add(new_match)
-            db.session.flush()
-
-            for player_info in full_match_info['match_players']:
-                player = Competitive_Match_Player(
-                    match_id = new_match.id,
-                    puuid = player_info['puuid'],
-                    name = player_info['name'],
-                    tag = player_info['tag'],
-                    agent = player_info['agent'],
-                    team = player_info['team'],
-                    party_id = player_info['party_id'],
-                    score = player_info['score'],
-                    kills = player_info['kills'],
-                    deaths = player_info['deaths'],
-                    assists = player_info['assists'],
-                    headshots = player_info['headshots'],
-                    bodyshots = player_info['bodyshots'],
-                    legshots = player_info['legshots'],
-                    damage_dealt = player_info['damage_dealt'],
-                    damage_received = player_info['damage_received'],
-                    c_ability = player_info['c_ability'],
-                    e_ability = player_info['e_ability'],
-                    q_ability = player_info['q_ability'],
-                    x_ability = player_info['x_ability']
-                )
-                db.session.add(player)
-            
-            for kill_info in full_match_info['match_kills']:
-                kill = Competitive_Match_Kill(
-                    match_id = new_match.id,
-                    time_in_round = kill_info['time_in_round'],
-                    round = kill_info['round'],
-                    killer_puuid = kill_info['killer_puuid'],
-                    victim_puuid = kill_info['victim_puuid'],
-                    killer_x = kill_info['killer_x'],
-                    killer_y = kill_info['killer_y'],
-                    victim_x = kill_info['victim_x'],
-                    victim_y = kill_info['victim_y'],
-                    killer_view = kill_info['killer_view'],
-                    weapon_id = kill_info['weapon_id'],
-                    assistants = kill_info.get('assistants', [])
-                )
-                db.session.add(kill)
+            # the worker or a backfill may have stored it while we fetched, serve what we fetched either way
+            try:
+                with db.session.begin_nested():
+                    ingest.persist_match(full_match_info)
+            except IntegrityError:
+                app.logger.info(f'Match {match_id} was stored by someone else meanwhile')
             db.session.commit()
 
-            return full_match_info
+            return projection.project_match(full_match_info, match_projection)
     else:
-        full_match_info = {
-            'match_id': existing_match.match_id,
-            'map': existing_match.map,
-            'game_length': existing_match.game_length,
-            'game_start': existing_match.game_start,
-            'region': existing_match.region,
-            'server': existing_match.server,
-            'blue_score': existing_match.blue_score,
-            'red_score': existing_match.red_score,
-            'who_won': existing_match.who_won
-        }
-
-        match_players = [
-            {
-                'puuid': player.puuid, 
-                'name': player.name, 
-                'tag': player.tag, 
-                'agent': player.agent, 
-                'party_id': player.party_id, 
-                'team': player.team,
-                'score': player.score, 
-                'kills': player.kills, 
-                'deaths': player.deaths, 
-                'assists': player.assists,
-                'headshots': player.headshots, 
-                'bodyshots': player.bodyshots, 
-                'legshots': player.legshots,
-                'damage_dealt': player.damage_dealt, 
-                'damage_received': player.damage_received,
-                'c_ability': player.c_ability, 
-                'e_ability': player.e_ability, 
-                'q_ability': player.q_ability, 
-                'x_ability': player.x_ability
-            } for player in existing_match.match_players
-        ]
-
-        match_kills = [
-            {
-                'match_id': kill.match_id,
-                'time_in_round': kill.time_in_round,
-                'round': kill.round,
-                'killer_puuid': kill.killer_puuid,
-                'victim_puuid': kill.victim_puuid,
-                'killer_x': kill.killer_x,
-                'killer_y': kill.killer_y,
-                'victim_x': kill.victim_x,
-                'victim_y': kill.victim_y,
-                'killer_view': kill.killer_view,
-                'weapon_id': kill.weapon_id,
-                'assistants': list(kill.assistants) if hasattr(kill, 'assistants') else []
-            } for kill in existing_match.match_kills
-        ]
-
-        full_match_info['match_players'] = match_players
-        full_match_info['match_kills'] = match_kills
-
-        return full_match_info
+        return serializers.match_to_dict(existing_match, match_projection)
 
 @app.route('/by-puuid/match-history/<puuid>')
-@cache.cached(timeout=300)
+@cache_tags.cached_view(lambda puuid: cache_tags.player_tags(puuid), timeout=300, unless=streaming.wants_stream)
 async def get_match_history_puuid_v2(puuid):
     is_player_in_basic_table_query = select(Valorant_Player).where(
         Valorant_Player.puuid == puuid
@@ -449,81 +435,31 @@ async def get_match_history_puuid_v2(puuid):
     else:
         
         map_filter = request.args.get('map')
+        match_projection = projection.get_match_projection()
 
         matches_list = (
             db.session.query(Competitive_Match)
             .join(Competitive_Match_Player)
             .filter(Competitive_Match_Player.puuid == puuid)
+            .options(*projection.match_loaders(match_projection))
         )
 
         if map_filter:
             matches_list = matches_list.filter(Competitive_Match.map == map_filter)
 
-        matches_list = matches_list.order_by(desc(Competitive_Match.game_start)).all()
-
-        matches_return_list = []
-        for existing_match in matches_list:
-            full_match_info = {
-                'match_id': existing_match.match_id,
-                'map': existing_match.map,
-                'game_length': existing_match.game_length,
-                'game_start': existing_match.game_start,
-                'region': existing_match.region,
-                'server': existing_match.server,
-                'blue_score': existing_match.blue_score,
-                'red_score': existing_match.red_score,
-                'who_won': existing_match.who_won
-            }
+        serialize = lambda match: serializers.match_to_dict(match, match_projection)
+        if streaming.wants_stream():
+            return streaming.stream_page(matches_list, [Competitive_Match.game_start, Competitive_Match.id], serialize, 'matches')
 
-            match_players = [
-                {
-                    'puuid': player.puuid, 
-                    'name': player.name, 
-                    'tag': player.tag, 
-                    'agent': player.agent, 
-                    'party_id': player.party_id, 
-                    'team': player.team,
-                    'score': player.score, 
-                    'kills': player.kills, 
-                    'deaths': player.deaths, 
-                    'assists': player.assists,
-                    'headshots': player.headshots, 
-                    'bodyshots': player.bodyshots, 
-                    'legshots': player.legshots,
-                    'damage_dealt': player.damage_dealt, 
-                    'damage_received': player.damage_received,
-                    'c_ability': player.c_ability, 
-                    'e_ability': player.e_ability, 
-                    'q_ability': player.q_ability, 
-                    'x_ability': player.x_ability
-                } for player in existing_match.match_players
-            ]
-
-            match_kills = [
-                {
-                    'match_id': kill.match_id,
-                    'time_in_round': kill.time_in_round,
-                    'round': kill.round,
-                    'killer_puuid': kill.killer_puuid,
-                    'victim_puuid': kill.victim_puuid,
-                    'killer_x': kill.killer_x,
-                    'killer_y': kill.killer_y,
-                    'victim_x': kill.victim_x,
-                    'victim_y': kill.victim_y,
-                    'killer_view': kill.killer_view,
-                    'weapon_id': kill.weapon_id,
-                    'assistants': list(kill.assistants) if hasattr(kill, 'assistants') else []
-                } for kill in existing_match.match_kills
-            ]
-
-            full_match_info['match_players'] = match_players
-            full_match_info['match_kills'] = match_kills
-            matches_return_list.append(full_match_info)
-
-        return {'matches': matches_return_list}
+        matches_list, next_cursor = pagination.paginate(matches_list, [Competitive_Match.game_start, Competitive_Match.id])
+
+        return {
+            'matches': [serialize(existing_match) for existing_match in matches_list],
+            'next_cursor': next_cursor
+        }
     
 @app.route('/match-history/<name>/<tag>')
-@cache.cached(timeout=300)
+@cache_tags.cached_view(lambda name, tag: cache_tags.player_tags(name=name, tag=tag), timeout=300, unless=streaming.wants_stream)
 async def get_match_history_username_v2(name, tag):
     is_player_in_basic_table_query = select(Valorant_Player).where(
         Valorant_Player.name == name,
@@ -536,75 +472,89 @@ async def get_match_history_username_v2(name, tag):
     else:
         
         map_filter = request.args.get('map')
+        match_projection = projection.get_match_projection()
 
         matches_list = (
             db.session.query(Competitive_Match)
             .join(Competitive_Match_Player)
             .filter(Competitive_Match_Player.puuid == existing_player.puuid)
+            .options(*projection.match_loaders(match_projection))
         )
 
         if map_filter:
             matches_list = matches_list.filter(Competitive_Match.map == map_filter)
 
-        matches_list = matches_list.order_by(desc(Competitive_Match.game_start)).all()
-
-        matches_return_list = []
-        for existing_match in matches_list:
-            full_match_info = {
-                'match_id': existing_match.match_id,
-                'map': existing_match.map,
-                'game_length': existing_match.game_length,
-                'game_start': existing_match.game_start,
-                'region': existing_match.region,
-                'server': existing_match.server,
-                'blue_score': existing_match.blue_score,
-                'red_score': existing_match.red_score,
-                'who_won': existing_match.who_won
-            }
+        serialize = lambda match: serializers.match_to_dict(match, match_projection)
+        if streaming.wants_stream():
+            return streaming.stream_page(matches_list, [Competitive_Match.game_start, Competitive_Match.id], serialize, 'matches')
+
+        matches_list, next_cursor = pagination.paginate(matches_list, [Competitive_Match.game_start, Competitive_Match.id])
+
+        return {
+            'matches': [serialize(existing_match) for existing_match in matches_list],
+            'next_cursor': next_cursor
+        }
+
+# K/D, headshot %, ADR and win rates overall and per agent/map, from the running totals in player_stats (kept by ingest.persist_match)
+# Only counts matches we have stored for the player
+
+@app.route('/stats/<puuid>')
+@cache_tags.cached_view(lambda puuid: cache_tags.player_tags(puuid), timeout=300)
+def get_player_stats_v2(puuid):
+    query = select(Player_Stats).where(
+        Player_Stats.puuid == puuid
+    )
+    rows = db.session.execute(query).scalars().all()
+
+    if not rows:
+        return {'error': f'<p>{puuid} has no stored matches yet!</p>'}, 404
+    return {'data': serializers.player_stats_to_dict(puuid, rows)}
+
+# Where kills happen (killer positions) and where deaths happen (victim positions) on a map, binned into grids (see heatmap.py)
+# ?puuid= only that player's kills/deaths, ?agent= only kills/deaths while playing that agent, ?weapon= only kills with that weapon id
+
+@app.route('/heatmap/<map>')
+@cache_tags.cached_view(lambda map: cache_tags.map_tags(map), timeout=300)
+def get_heatmap_v2(map):
+    return {
+        'data': heatmap.get_heatmap(
+            map,
+            puuid=request.args.get('puuid') or None,
+            agent=request.args.get('agent') or None,
+            weapon=request.args.get('weapon') or None
+        )
+    }
 
-            match_players = [
-                {
-                    'puuid': player.puuid, 
-                    'name': player.name, 
-                    'tag': player.tag, 
-                    'agent': player.agent, 
-                    'party_id': player.party_id, 
-                    'team': player.team,
-                    'score': player.score, 
-                    'kills': player.kills, 
-                    'deaths': player.deaths, 
-                    'assists': player.assists,
-                    'headshots': player.headshots, 
-                    'bodyshots': player.bodyshots, 
-                    'legshots': player.legshots,
-                    'damage_dealt': player.damage_dealt, 
-                    'damage_received': player.damage_received,
-                    'c_ability': player.c_ability, 
-                    'e_ability': player.e_ability, 
-                    'q_ability': player.q_ability, 
-                    'x_ability': player.x_ability
-                } for player in existing_match.match_players
-            ]
-
-            match_kills = [
-                {
-                    'match_id': kill.match_id,
-                    'time_in_round': kill.time_in_round,
-                    'round': kill.round,
-                    'killer_puuid': kill.killer_puuid,
-                    'victim_puuid': kill.victim_puuid,
-                    'killer_x': kill.killer_x,
-                    'killer_y': kill.killer_y,
-                    'victim_x': kill.victim_x,
-                    'victim_y': kill.victim_y,
-                    'killer_view': kill.killer_view,
-                    'weapon_id': kill.weapon_id,
-                    'assistants': list(kill.assistants) if hasattr(kill, 'assistants') else []
-                } for kill in existing_match.match_kills
-            ]
-
-            full_match_info['match_players'] = match_players
-            full_match_info['match_kills'] = match_kills
-            matches_return_list.append(full_match_info)
-
-        return {'matches': matches_return_list}
\ No newline at end of file
+# A whole table as one Parquet file for the matches after ?after=<competitive_match.id>, X-Export-Watermark is where the next export starts
+# For bigger or regular exports use python export.py (partitioned files, keeps its own watermark)
+
+@app.route('/export/<table>.parquet')
+def get_export_v2(table):
+    if table not in export.EXPORT_TABLES:
+        return {'error': f'<p>{table} can not be exported, try one of {", ".join(export.EXPORT_TABLES)}</p>'}, 404
+
+    try:
+        after = int(request.args.get('after', 0))
+    except ValueError:
+        return {'error': '<p>after must be a match id</p>'}, 400
+
+    file, until, rows = export.export_table_file(table, after)
+    response = send_file(file, mimetype=export.PARQUET_MIMETYPE, as_attachment=True, download_name=f'{table}-{after}-{until}.parquet')
+    response.headers['X-Export-Watermark'] = str(until)
+    response.headers['X-Export-Rows'] = str(rows)
+    return response
+
+# Fetch and store the matches in a player's stored mmr history that we don't have yet (see backfill.py), ?limit= most recent ones
+# (at most BACKFILL_MAX_MATCHES, also the default)
+
+@app.route('/backfill/<puuid>', methods=['POST'])
+async def backfill_player_matches_v2(puuid):
+    try:
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+    except ValueError:
+        return {'error': '<p>limit must be a number</p>'}, 400
+    # anyone can POST this and every match is an upstream call at interactive priority, so it's capped (python backfill.py isn't)
+    if limit is not None and not 1 <= limit <= app.config['BACKFILL_MAX_MATCHES']:
+        return {'error': f'<p>limit must be between 1 and {app.config["BACKFILL_MAX_MATCHES"]}</p>'}, 400
+
+    return {'data': await backfill.backfill_player_matches(puuid, limit)}
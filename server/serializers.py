@@ -0,0 +1,124 @@
+from models import MMR_History, Competitive_Match, Competitive_Match_Player, Competitive_Match_Kill, Player_Stats
+from projection import MatchProjection, FULL_MATCH
+
+from typing import List
+
+'''
+Turn stored rows into the dicts our endpoints return (same shape as what val.py returns for a fresh fetch)
+'''
+
+def match_player_to_dict(player: Competitive_Match_Player) -> dict:
+    return {
+        'puuid': player.puuid,
+        'name': player.name,
+        'tag': player.tag,
+        'agent': player.agent,
+        'party_id': player.party_id,
+        'team': player.team,
+        'score': player.score,
+        'kills': player.kills,
+        'deaths': player.deaths,
+        'assists': player.assists,
+        'headshots': player.headshots,
+        'bodyshots': player.bodyshots,
+        'legshots': player.legshots,
+        'damage_dealt': player.damage_dealt,
+        'damage_received': player.damage_received,
+        'c_ability': player.c_ability,
+        'e_ability': player.e_ability,
+        'q_ability': player.q_ability,
+        'x_ability': player.x_ability
+    }
+
+def match_kill_to_dict(kill: Competitive_Match_Kill) -> dict:
+    return {
+        'match_id': kill.match_id,
+        'time_in_round': kill.time_in_round,
+        'round': kill.round,
+        'killer_puuid': kill.killer_puuid,
+        'victim_puuid': kill.victim_puuid,
+        'killer_x': kill.killer_x,
+        'killer_y': kill.killer_y,
+        'victim_x': kill.victim_x,
+        'victim_y': kill.victim_y,
+        'killer_view': kill.killer_view,
+        'weapon_id': kill.weapon_id,
+        'assistants': list(kill.assistants) if kill.assistants is not None else []
+    }
+
+# Expects the included lists to be eager loaded (see projection.match_loaders), otherwise each match costs a query per list
+# Lists the projection leaves out aren't touched, so they never load
+
+def match_to_dict(match: Competitive_Match, projection: MatchProjection = FULL_MATCH) -> dict:
+    data = {
+        'match_id': match.match_id,
+        'map': match.map,
+        'game_length': match.game_length,
+        'game_start': match.game_start,
+        'region': match.region,
+        'server': match.server,
+        'blue_score': match.blue_score,
+        'red_score': match.red_score,
+        'who_won': match.who_won
+    }
+    if projection.fields is not None:
+        data = {field: value for field, value in data.items() if field in projection.fields}
+
+    if 'players' in projection.include:
+        data['match_players'] = [match_player_to_dict(player) for player in match.match_players]
+    if 'kills' in projection.include:
+        data['match_kills'] = [match_kill_to_dict(kill) for kill in match.match_kills]
+    return data
+
+def mmr_history_to_dict(match: MMR_History) -> dict:
+    return {
+        'match_id': match.match_id,
+        'mmr_change': match.mmr_change,
+        'refunded_rr': match.refunded_rr,
+        'was_derank_protected': match.was_derank_protected,
+        'map': match.map,
+        'puuid': match.puuid,
+        'account_rank': match.account_rank,
+        'account_rr': match.account_rr,
+        'account_rank_img': match.account_rank_img,
+        'date': match.date
+    }
+
+def _ratio(numerator: int, denominator: int, scale: int = 1) -> float:
+    return round(numerator * scale / denominator, 2) if denominator else 0.0
+
+def player_stats_row_to_dict(stats: Player_Stats) -> dict:
+    return {
+        'matches': stats.matches,
+        'wins': stats.wins,
+        'losses': stats.matches - stats.wins - stats.ties,
+        'ties': stats.ties,
+        'rounds': stats.rounds,
+        'score': stats.score,
+        'kills': stats.kills,
+        'deaths': stats.deaths,
+        'assists': stats.assists,
+        'headshots': stats.headshots,
+        'bodyshots': stats.bodyshots,
+        'legshots': stats.legshots,
+        'damage_dealt': stats.damage_dealt,
+        'damage_received': stats.damage_received,
+        'kd': _ratio(stats.kills, max(stats.deaths, 1)),
+        'headshot_pct': _ratio(stats.headshots, stats.headshots + stats.bodyshots + stats.legshots, 100),
+        'adr': _ratio(stats.damage_dealt, stats.rounds),
+        'acs': _ratio(stats.score, stats.rounds),
+        'win_rate': _ratio(stats.wins, stats.matches, 100)
+    }
+
+# All player_stats rows of one player -> {'overall': {...}, 'agents': {agent: {...}}, 'maps': {map: {...}}}
+
+def player_stats_to_dict(puuid: str, rows: List[Player_Stats]) -> dict:
+    stats = {'puuid': puuid, 'overall': None, 'agents': {}, 'maps': {}}
+    for row in rows:
+        if row.scope == 'overall':
+            stats['overall'] = player_stats_row_to_dict(row)
+        elif row.scope == 'agent':
+            stats['agents'][row.scope_value] = player_stats_row_to_dict(row)
+        elif row.scope == 'map':
+            stats['maps'][row.scope_value] = player_stats_row_to_dict(row)
+    return stats
@@ -0,0 +1,57 @@
+from flask import request, current_app, Response, stream_with_context
+
+from models import db
+import pagination
+
+'''
+Streaming responses for the endpoints that can return a lot of rows
+- Rows come off a server-side cursor (yield_per) and are serialized one at a time, so memory stays flat however big the result is
+- Accept: application/x-ndjson gets one JSON document per line, ?stream=true gets the usual {"<key>": [...], "next_cursor": ...} sent in chunks
+- Streams aren't paged by default, ?limit= and ?cursor= still work (the next cursor comes last: the final line in NDJSON, the last key in JSON)
+'''
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Rows fetched from the DB per round trip while streaming
+
+STREAM_BATCH_SIZE = 200
+
+def wants_ndjson() -> bool:
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+def wants_stream() -> bool:
+    return wants_ndjson() or str(request.args.get('stream')).lower() == 'true'
+
+def stream_page(query, columns, serialize, key: str, descending: bool = True) -> Response:
+    limit, cursor = pagination.get_page_args(len(columns), default_limit=None, max_limit=None)
+    query = pagination.order_page(query, columns, cursor, descending)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    statement = query.statement.execution_options(yield_per=STREAM_BATCH_SIZE)
+
+    ndjson = wants_ndjson()
+    dumps = current_app.json.dumps
+
+    def generate():
+        last_row, count, next_cursor = None, 0, None
+        if not ndjson:
+            yield '{"%s":[' % key
+
+        for row in db.session.scalars(statement):
+            if count == limit:
+                next_cursor = pagination.row_cursor(last_row, columns)
+                break
+
+            if ndjson:
+                yield dumps(serialize(row)) + '\n'
+            else:
+                yield (',' if count else '') + dumps(serialize(row))
+            last_row, count = row, count + 1
+
+        if ndjson:
+            if next_cursor is not None:
+                yield dumps({'next_cursor': next_cursor}) + '\n'
+        else:
+            yield '],"next_cursor":%s}' % dumps(next_cursor)
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE if ndjson else 'application/json')
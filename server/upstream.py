@@ -0,0 +1,372 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import atexit
+import itertools
+import threading
+import contextvars
+import functools
+import email.utils
+
+import aiohttp
+
+import codec
+import metrics
+
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from typing import Optional, Dict, NamedTuple
+
+'''
+One pooled aiohttp ClientSession per worker process for every upstream call (henrikdev, valorant-api)
+- Flask runs each async view in its own short lived event loop, so a session can't be shared between requests directly
+- Instead the session lives on a dedicated I/O loop thread and val.py awaits its requests from whatever loop the view runs in
+- Connections are kept alive between requests and DNS results are cached, so we only pay the TLS handshake once per host
+- Every request waits on a per-host token bucket that follows the x-ratelimit-* headers, so we don't burn the quota at peak
+- 429s honor Retry-After and 5xx/connection errors are retried with jittered exponential backoff
+- Route calls (interactive) are handed tokens before background work, which also has to leave a reserve in the bucket
+- Fetchers marked with @single_flight share one in-flight call per (endpoint, args), so a burst of cache misses costs one upstream request
+'''
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+_priority = contextvars.ContextVar('upstream_priority', default=PRIORITY_INTERACTIVE)
+# the @single_flight fetcher a request is made for, metrics are labelled with it
+_function = contextvars.ContextVar('upstream_function', default=None)
+
+# Raised when the upstream can't answer in time (out of quota, erroring); routes turn this into a 503
+
+class UpstreamUnavailable(Exception):
+    def __init__(self, url: str, status: int, retry_after: float):
+        super().__init__(f'{url} unavailable (status {status}), retry after {retry_after:.0f}s')
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+
+class UpstreamResponse(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    data: Optional[dict]
+
+_settings = {
+    'total_timeout': 10.0,
+    'connect_timeout': 3.0,
+    'limit': 100,
+    'limit_per_host': 20,
+    'dns_ttl': 300,
+    'keepalive_timeout': 30.0,
+    'rate_limit': 30,
+    'rate_window': 60.0,
+    'max_retries': 3,
+    'backoff_base': 0.5,
+    'backoff_cap': 8.0,
+    'max_wait': 5.0,
+    'background_max_wait': 120.0,
+    'background_reserve': 0.2
+}
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_session: Optional[aiohttp.ClientSession] = None
+_pid: Optional[int] = None
+_start_lock = threading.Lock()
+_buckets: Dict[str, 'TokenBucket'] = {}
+_in_flight: Dict[tuple, asyncio.Future] = {}
+_single_flight_stats: Dict[str, Dict[str, int]] = {}
+
+# Read the client settings from the app config and open the session for this worker
+
+def init_app(app):
+    _settings.update({
+        'total_timeout': app.config.get('UPSTREAM_TOTAL_TIMEOUT', _settings['total_timeout']),
+        'connect_timeout': app.config.get('UPSTREAM_CONNECT_TIMEOUT', _settings['connect_timeout']),
+        'limit': app.config.get('UPSTREAM_LIMIT', _settings['limit']),
+        'limit_per_host': app.config.get('UPSTREAM_LIMIT_PER_HOST', _settings['limit_per_host']),
+        'dns_ttl': app.config.get('UPSTREAM_DNS_TTL', _settings['dns_ttl']),
+        'keepalive_timeout': app.config.get('UPSTREAM_KEEPALIVE_TIMEOUT', _settings['keepalive_timeout']),
+        'rate_limit': app.config.get('UPSTREAM_RATE_LIMIT', _settings['rate_limit']),
+        'rate_window': app.config.get('UPSTREAM_RATE_WINDOW', _settings['rate_window']),
+        'max_retries': app.config.get('UPSTREAM_MAX_RETRIES', _settings['max_retries']),
+        'backoff_base': app.config.get('UPSTREAM_BACKOFF_BASE', _settings['backoff_base']),
+        'backoff_cap': app.config.get('UPSTREAM_BACKOFF_CAP', _settings['backoff_cap']),
+        'max_wait': app.config.get('UPSTREAM_MAX_WAIT', _settings['max_wait']),
+        'background_max_wait': app.config.get('UPSTREAM_BACKGROUND_MAX_WAIT', _settings['background_max_wait']),
+        'background_reserve': app.config.get('UPSTREAM_BACKGROUND_RESERVE', _settings['background_reserve'])
+    })
+    start()
+    atexit.register(stop)
+
+def _run_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+async def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=_settings['limit'],
+        limit_per_host=_settings['limit_per_host'],
+        use_dns_cache=True,
+        ttl_dns_cache=_settings['dns_ttl'],
+        keepalive_timeout=_settings['keepalive_timeout']
+    )
+    timeout = aiohttp.ClientTimeout(total=_settings['total_timeout'], sock_connect=_settings['connect_timeout'])
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+# Start the I/O loop thread and session (again, if we were forked from a process that already had one)
+
+def start():
+    global _loop, _thread, _session, _pid
+
+    with _start_lock:
+        if _loop is not None and _pid == os.getpid():
+            return
+
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=_run_loop, args=(loop,), name='upstream-io', daemon=True)
+        thread.start()
+
+        _session = asyncio.run_coroutine_threadsafe(_create_session(), loop).result()
+        _buckets.clear()
+        _in_flight.clear()
+        _loop, _thread, _pid = loop, thread, os.getpid()
+
+# Close the session and stop the I/O loop (registered with atexit, so workers shut down cleanly)
+
+def stop():
+    global _loop, _thread, _session, _pid
+
+    with _start_lock:
+        if _loop is None or _pid != os.getpid():
+            return
+
+        try:
+            asyncio.run_coroutine_threadsafe(_session.close(), _loop).result(timeout=5)
+        finally:
+            _loop.call_soon_threadsafe(_loop.stop)
+            _thread.join(timeout=5)
+            _loop.close()
+            _loop, _thread, _session, _pid = None, None, None, None
+            _buckets.clear()
+            _in_flight.clear()
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    if _loop is None or _pid != os.getpid():
+        start()
+    return _loop
+
+# Run a coroutine on the I/O loop and wait for it from the caller's loop
+
+async def run(coro):
+    loop = get_loop()
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+
+    if running_loop is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+# Token bucket for one upstream host, only ever touched from the I/O loop
+# Waiters are served in (priority, arrival) order, background waiters also have to leave `reserve` tokens behind
+
+class TokenBucket:
+    def __init__(self, limit: int, window: float, reserve: float):
+        self.capacity = float(limit)
+        self.rate = limit / window
+        self.reserve = reserve
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _needed(self, priority: int) -> float:
+        if priority == PRIORITY_BACKGROUND:
+            return 1 + self.capacity * self.reserve
+        return 1
+
+    def _dispatch(self):
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if now < self.blocked_until or self.tokens < self._needed(priority):
+                break
+            heapq.heappop(self._waiters)
+            self.tokens -= 1
+            future.set_result(None)
+
+        if self._waiters:
+            priority = self._waiters[0][0]
+            delay = max(self.blocked_until - now, (self._needed(priority) - self.tokens) / self.rate, 0.01)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    async def acquire(self, priority: int, max_wait: float):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+        await asyncio.wait_for(future, max_wait)
+
+    # Pace the rest of the window by what the API says we have left
+
+    def update_from_headers(self, headers: Dict[str, str]):
+        limit = _parse_number(headers.get('x-ratelimit-limit'))
+        remaining = _parse_number(headers.get('x-ratelimit-remaining'))
+        reset = _parse_number(headers.get('x-ratelimit-reset'))
+
+        self._refill(time.monotonic())
+        if limit:
+            self.capacity = limit
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+            if reset:
+                if remaining < 1:
+                    self.block_for(reset)
+                else:
+                    self.rate = remaining / reset
+
+    def block_for(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+def _parse_number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+# Retry-After is either a number of seconds or an HTTP date
+
+def _parse_retry_after(headers: Dict[str, str]) -> Optional[float]:
+    value = headers.get('retry-after')
+    if value is None:
+        return _parse_number(headers.get('x-ratelimit-reset'))
+
+    seconds = _parse_number(value)
+    if seconds is not None:
+        return max(seconds, 0.0)
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(_settings['backoff_cap'], _settings['backoff_base'] * 2 ** attempt))
+
+def _get_bucket(url: str) -> TokenBucket:
+    host = urlsplit(url).netloc
+    if host not in _buckets:
+        _buckets[host] = TokenBucket(_settings['rate_limit'], _settings['rate_window'], _settings['background_reserve'])
+    return _buckets[host]
+
+# Wait for a token, send the request and retry 429/5xx/connection errors until we run out of attempts or time
+
+async def _get(url, headers, priority):
+    bucket = _get_bucket(url)
+    max_wait = _settings['background_max_wait'] if priority == PRIORITY_BACKGROUND else _settings['max_wait']
+    deadline = time.monotonic() + max_wait
+    status, retry_after = 503, _settings['backoff_base']
+
+    function = _function.get() or urlsplit(url).netloc
+
+    for attempt in range(_settings['max_retries'] + 1):
+        try:
+            await bucket.acquire(priority, max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise UpstreamUnavailable(url, 429, max(bucket.blocked_until - time.monotonic(), retry_after))
+
+        start = time.perf_counter()
+        try:
+            async with _session.get(url, headers=headers) as response:
+                response_headers = {key.lower(): value for key, value in response.headers.items()}
+                bucket.update_from_headers(response_headers)
+                status = response.status
+
+                if status == 429:
+                    retry_after = _parse_retry_after(response_headers) or _backoff(attempt)
+                    bucket.block_for(retry_after)
+                elif status >= 500:
+                    retry_after = _backoff(attempt)
+                else:
+                    data = None
+                    if status == 200:
+                        data = codec.loads(await response.read())
+                    metrics.observe_upstream(function, status, time.perf_counter() - start)
+                    return UpstreamResponse(status, response_headers, data)
+            metrics.observe_upstream(function, status, time.perf_counter() - start)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            metrics.observe_upstream(function, 'error', time.perf_counter() - start)
+            status, retry_after = 503, _backoff(attempt)
+
+        if attempt == _settings['max_retries'] or time.monotonic() + retry_after > deadline:
+            break
+        if status != 429:
+            await asyncio.sleep(retry_after)
+
+    raise UpstreamUnavailable(url, status, retry_after)
+
+# GET a JSON document through the shared session (interactive priority unless called inside background())
+
+async def get(url: str, headers: Optional[Dict[str, str]] = None) -> UpstreamResponse:
+    return await run(_get(url, headers, _priority.get()))
+
+# Mark upstream calls made inside this block as background work (refreshes, backfills)
+
+@contextmanager
+def background():
+    token = _priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+# Join the in-flight call for this key or start it, runs on the I/O loop so every request in the worker shares it
+
+async def _join(fn, args, kwargs, priority):
+    key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+    stats = _single_flight_stats.setdefault(fn.__name__, {'calls': 0, 'coalesced': 0})
+    stats['calls'] += 1
+
+    future = _in_flight.get(key)
+    if future is None:
+        token, function_token = _priority.set(priority), _function.set(fn.__name__)
+        try:
+            future = asyncio.ensure_future(fn(*args, **kwargs))
+        finally:
+            _priority.reset(token)
+            _function.reset(function_token)
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    else:
+        stats['coalesced'] += 1
+
+    # shield so one caller giving up doesn't cancel the call for everyone else waiting on it
+    return await asyncio.shield(future)
+
+# Coalesce concurrent identical calls of an upstream fetcher (callers share the result, don't mutate it)
+
+def single_flight(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(_join(fn, args, kwargs, _priority.get()))
+    return wrapper
+
+# How many calls each @single_flight fetcher got and how many of them were coalesced
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    return {name: dict(stats) for name, stats in _single_flight_stats.items()}
@@ -0,0 +1,128 @@
+import asyncio
+import signal
+import argparse
+
+from sqlalchemy import select
+from app import app
+from models import Valorant_Player, Competitive_Match
+
+import val
+import jobs
+import ingest
+import asyncdb
+import upstream
+
+'''
+Background ingestion worker, run next to the web workers: python worker.py
+- Claims refresh jobs from the refresh_job table (see jobs.py) and runs up to WORKER_CONCURRENCY of them at a time
+- Upstream calls go through the same val.py fetchers as the routes, at background priority so interactive calls go first
+- Every job is fetch (await) then store (one transaction through asyncdb.run_sync), so a session never holds a transaction across an await
+- With ASYNC_DB=true the stores run on the async engine, so one job's DB round trips no longer stall the other jobs on this loop
+Run from server/: python worker.py [--drain] (--drain exits once no job is runnable)
+'''
+
+class JobSkipped(Exception):
+    pass
+
+def store_player(player_info, session):
+    existing_player = session.execute(
+        select(Valorant_Player).where(Valorant_Player.puuid == player_info['puuid'])
+    ).scalar_one_or_none()
+    ingest.store_player(player_info, existing_player, session=session)
+
+async def refresh_player(payload):
+    if 'puuid' in payload:
+        player_info = await val.get_verbose_player_stats(payload['puuid'])
+    else:
+        player_info = await val.get_player_stats(payload['name'], payload['tag'])
+    if player_info is None:
+        raise JobSkipped(f'no account for {payload}')
+
+    await asyncdb.run_sync(store_player, player_info)
+
+async def refresh_mmr_history(payload):
+    mmr_history = await val.get_player_comp_mmr_history_by_puuid(payload['region'], payload['puuid'])
+    if mmr_history is None:
+        raise JobSkipped(f'no mmr history for {payload["puuid"]}')
+
+    matches_added = await asyncdb.run_sync(ingest.ingest_mmr_history, payload['puuid'], mmr_history)
+    app.logger.info(f'Added {matches_added} matches to the db for {payload["puuid"]}')
+
+def is_match_stored(match_id, session) -> bool:
+    return session.execute(select(Competitive_Match.id).where(Competitive_Match.match_id == match_id)).scalar_one_or_none() is not None
+
+def store_match(full_match_info, session):
+    if not is_match_stored(full_match_info['match_id'], session):
+        ingest.persist_match(full_match_info, session=session)
+
+async def fetch_match(payload):
+    if await asyncdb.run_sync(is_match_stored, payload['match_id']):
+        return
+
+    full_match_info = await val.get_match_info(payload['region'], payload['match_id'])
+    if full_match_info is None:
+        raise JobSkipped(f'cannot retrieve match {payload["match_id"]}')
+
+    await asyncdb.run_sync(store_match, full_match_info)
+
+JOB_HANDLERS = {
+    jobs.KIND_PLAYER: refresh_player,
+    jobs.KIND_MMR_HISTORY: refresh_mmr_history,
+    jobs.KIND_MATCH: fetch_match
+}
+
+async def run_job(job):
+    try:
+        with upstream.background():
+            await JOB_HANDLERS[job['kind']](job['payload'])
+        await asyncdb.run_sync(jobs.complete, job['id'])
+    except JobSkipped as error:
+        # upstream answered but has nothing for us, retrying won't help
+        app.logger.info(f'Skipped {job["kind"]} job {job["key"]}: {error}')
+        await asyncdb.run_sync(jobs.complete, job['id'])
+    except Exception as error:
+        app.logger.warning(f'{job["kind"]} job {job["key"]} failed (attempt {job["attempts"]}): {error!r}')
+        await asyncdb.run_sync(jobs.fail, job, repr(error), app.config['JOB_MAX_ATTEMPTS'], app.config['JOB_RETRY_DELAY'])
+
+async def main(drain: bool = False):
+    concurrency = app.config['WORKER_CONCURRENCY']
+    running = set()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    app.logger.info(f'Worker started with {concurrency} slots')
+    while not stopping.is_set():
+        if len(running) >= concurrency:
+            await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            continue
+
+        claimed = await asyncdb.run_sync(jobs.claim, concurrency - len(running), app.config['JOB_LEASE_SECONDS'])
+        for job in claimed:
+            task = asyncio.create_task(run_job(job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+
+        if not claimed and drain and not running:
+            break
+        if not claimed:
+            try:
+                await asyncio.wait_for(stopping.wait(), app.config['WORKER_POLL_INTERVAL'])
+            except asyncio.TimeoutError:
+                pass
+
+    # let in-flight jobs finish, anything we don't get to is picked up again once its lease runs out
+    if running:
+        await asyncio.wait(running, timeout=app.config['JOB_LEASE_SECONDS'])
+    app.logger.info('Worker stopped')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run refresh jobs from the refresh_job table')
+    parser.add_argument('--drain', action='store_true', help='exit once no job is runnable instead of polling for more')
+    args = parser.parse_args()
+
+    with app.app_context():
+        app.logger.setLevel('INFO')
+        asyncio.run(main(args.drain))